@@ -1,42 +1,170 @@
 import os
 
-from flask import Flask, session, request
+import click
+from flask import Flask, Response, current_app, session, request
+from flask.cli import ScriptInfo
 from dotenv import load_dotenv
-from flask_bcrypt import Bcrypt
-from flask_migrate import Migrate
 from flask_restful import Api, Resource
 
-from models import db, Admin, Vehicle, Driver, Trip, Route, MaintenanceRecord, ChargingSession
+from models import db, bcrypt, Admin, Vehicle, Driver, Trip, Route, MaintenanceRecord, ChargingSession
+from pagination import paginate, pagination_key, PaginationError
+from streaming import representation, wants_stream, stream_query, stream_response
+from fieldsets import parse_fieldset, FieldsetError
+from filters import apply_filters, equals, flag, is_null, on_or_after, before, parse_ids, FilterError
+from changes import parse_since, change_keys, changes, ChangesError
+from rollups import parse_energy_args, energy_report, ENERGY_TABLES, backfill_energy_rollups_command
+from utilization import parse_utilization_args, utilization_report, UTILIZATION_TABLES
+from load import parse_load_args, load_report, CHARGING_LOAD_TABLES
+from ingest import parse_chunk_size, read_records, ingest, IngestError, TRIP_SPEC, CHARGING_SESSION_SPEC
+from vehicle_status import parse_status_changes, apply_status_changes, StatusUpdateError
+from dashboard import dashboard, parse_dashboard_args, DASHBOARD_TABLES
+from availability import parse_availability_args, availability, AVAILABILITY_TABLES
+from spatial import route_index, parse_nearest_args, parse_within_args, ROUTE_TABLES
+from versions import Validators, resource_tables
+from cache import response_cache
+from auth import current_admin, login_required
+from passwords import password_hasher, PasswordHasherBusy
+from pool import engine_options, init_pool_stats, pool_stats
+from replicas import replica_binds, init_replicas, replica_stats
+from metrics import metrics_registry, init_metrics, serialization_timer, timed_representation
+from loaders import (
+    loader_plan,
+    VEHICLE_INCLUDE, DRIVER_INCLUDE, TRIP_INCLUDE, ROUTE_INCLUDE, ROUTE_DETAIL_INCLUDE,
+    MAINTENANCE_RECORD_INCLUDE, CHARGING_SESSION_INCLUDE,
+)
 from flask_cors import CORS
 
-load_dotenv()
 
-app = Flask(__name__)
+REQUIRED_SETTINGS = ('SECRET_KEY', 'SQLALCHEMY_DATABASE_URI')
+
+
+def env_int(name):
+    value = os.environ.get(name)
+    return None if value is None else int(value)
+
+
+def env_float(name):
+    value = os.environ.get(name)
+    return None if value is None else float(value)
+
+
+def env_list(name):
+    value = os.environ.get(name)
+    return None if value is None else [item.strip() for item in value.split(',') if item.strip()]
+
+
+def env_flag(name):
+    value = os.environ.get(name)
+    return None if value is None else value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def environment_config():
+    """Application configuration from the environment (and `.env`); unset
+    variables are left out so that Flask's defaults apply."""
+    load_dotenv()
+    config = {
+        'SECRET_KEY': os.environ.get('SECRET_KEY'),
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('SQLALCHEMY_DATABASE_URI'),
+        'SALQLCHEMY_TRACK_MODIFICATIONS': os.environ.get('SQLALCHEMY_TRACK_MODIFICATIONS'),
+        'APP_JSON_COMPACT': os.environ.get('APP_JSON_COMPACT'),
+        'SESSION_COOKIE_SAMESITE': os.environ.get('SESSION_COOKIE_SAMESITE'),
+        'SESSION_COOKIE_SECURE': os.environ.get('SESSION_COOKIE_SECURE'),
+        'REMEMBER_COOKIE_SECURE': os.environ.get('REMEMBER_COOKIE_SECURE'),
 
-# Application configurations
-app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['SQLALCHEMY_DATABASE_URI']
-app.config['SALQLCHEMY_TRACK_MODIFICATIONS'] = os.environ['SQLALCHEMY_TRACK_MODIFICATIONS']
-app.json.compact = os.environ['APP_JSON_COMPACT']
-app.config['SESSION_COOKIE_SAMESITE'] = os.environ['SESSION_COOKIE_SAMESITE']
-app.config['SESSION_COOKIE_SECURE'] = os.environ['SESSION_COOKIE_SECURE']
-app.config['REMEMBER_COOKIE_SECURE'] = os.environ['REMEMBER_COOKIE_SECURE']
+        # Response cache: 'memory' (per worker), 'redis' (shared) or 'none'.
+        # See cache.py for the defaults.
+        'RESPONSE_CACHE': os.environ.get('RESPONSE_CACHE'),
+        'RESPONSE_CACHE_TTL': env_int('RESPONSE_CACHE_TTL'),
+        'RESPONSE_CACHE_MAX_ENTRIES': env_int('RESPONSE_CACHE_MAX_ENTRIES'),
+        'RESPONSE_CACHE_REDIS_URL': os.environ.get('RESPONSE_CACHE_REDIS_URL'),
 
+        # Password hashing: bcrypt work factor, hashing threads and how many hashes
+        # may wait for one before sign-ins are turned away with a 503. See
+        # passwords.py for the defaults.
+        'BCRYPT_LOG_ROUNDS': env_int('BCRYPT_LOG_ROUNDS'),
+        'PASSWORD_HASH_WORKERS': env_int('PASSWORD_HASH_WORKERS'),
+        'PASSWORD_HASH_QUEUE': env_int('PASSWORD_HASH_QUEUE'),
 
-bcrypt = Bcrypt(app)
+        # Connection pool of each worker process; SQLAlchemy's defaults apply
+        # to anything unset. See pool.py.
+        'DB_POOL_SIZE': env_int('DB_POOL_SIZE'),
+        'DB_MAX_OVERFLOW': env_int('DB_MAX_OVERFLOW'),
+        'DB_POOL_TIMEOUT': env_int('DB_POOL_TIMEOUT'),
+        'DB_POOL_RECYCLE': env_int('DB_POOL_RECYCLE'),
+        'DB_POOL_PRE_PING': env_flag('DB_POOL_PRE_PING'),
+        'DB_POOL_WARMUP': env_int('DB_POOL_WARMUP'),
+        'DB_STATEMENT_TIMEOUT': env_int('DB_STATEMENT_TIMEOUT'),
 
-migrate = Migrate(app=app, db=db)
+        # Read replicas for GET requests, passed over while they lag the
+        # primary by more than REPLICA_MAX_LAG seconds. See replicas.py.
+        'REPLICA_DATABASE_URIS': env_list('REPLICA_DATABASE_URIS'),
+        'REPLICA_MAX_LAG': env_float('REPLICA_MAX_LAG'),
+        'REPLICA_LAG_CHECK_INTERVAL': env_float('REPLICA_LAG_CHECK_INTERVAL'),
 
-db.init_app(app)
+        # Directory shared by the worker processes for /metrics, emptied by
+        # gunicorn on start, and the bearer token it asks for. See metrics.py.
+        'METRICS_DIR': os.environ.get('METRICS_DIR'),
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+    }
+    return {name: value for name, value in config.items() if value is not None}
 
-api = Api(app=app)
 
-CORS(app=app, supports_credentials=True)
+def create_app(config=None):
+    """A new application, configured from the environment and then `config`.
+
+    Each app has its own caches, indexes and thread pools (see app_state),
+    created the first time a request needs them rather than here, and the
+    `flask db` commands only import Flask-Migrate when they are run.
+    """
+    app = Flask(__name__)
+
+    app.config.from_mapping(environment_config())
+    if config:
+        app.config.from_mapping(config)
+    missing = [name for name in REQUIRED_SETTINGS if not app.config.get(name)]
+    if missing:
+        raise RuntimeError(f"Missing configuration: {', '.join(missing)}")
+    app.json.compact = app.config.get('APP_JSON_COMPACT')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = {**replica_binds(app.config), **app.config.get('SQLALCHEMY_BINDS', {})}
+
+    db.init_app(app)
+    init_pool_stats(app)
+    init_replicas(app)
+    init_metrics(app)
+    bcrypt.init_app(app)
+    CORS(app=app, supports_credentials=True)
+
+    api = Api(app=app)
+    api.representations['application/json'] = timed_representation(api.representations['application/json'])
+    register_resources(api)
+
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(backfill_energy_rollups_command)
+    return app
+
+
+class LazyMigrateCommand(click.Command):
+    """Flask-Migrate's `db` group, imported only when it is run: importing
+    it (and Alembic) takes longer than creating the rest of the app."""
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as group
+
+        app = parent.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return group.make_context(info_name, args, parent=parent, **extra)
+
+
+migrate_command = LazyMigrateCommand('db', help='Perform database migrations.')
 
 # Handlng serialization errors.
 def handle_serialization_error(e, model_name, record_id):
-    print(f"Error serializing {model_name} ID: {record_id}. Error: {e}")
-    
+    current_app.logger.error('Error serializing %s ID: %s', model_name, record_id, exc_info=e)
+    metrics_registry.count_serialization_error(model_name)
+
     if isinstance(e, RecursionError):
         error_message = "Serialization failed due to recursion"
     else:
@@ -44,7 +172,19 @@ def handle_serialization_error(e, model_name, record_id):
 
     return {"error": error_message, "record_id": record_id}
 
+def serialize_rows(rows, include, fields, model_name):
+    for row in rows:
+        try:
+            with serialization_timer():
+                data = row.to_dict(include=include, fields=fields)
+        except Exception as e:
+            data = handle_serialization_error(e, model_name, row.id)
+        yield data
+
 # AUTHENTICATION AND AUTHORIZATION
+def password_hasher_busy():
+    return {'error': 'Too many sign-ins in progress, try again shortly'}, 503, {'Retry-After': '1'}
+
 class ClearSession(Resource):
     def delete(self):
         session['admin_id'] = None
@@ -60,7 +200,14 @@ class Login(Resource):
         
         admin = Admin.query.filter_by(email=email).first()
 
-        if admin and admin.authenticate(password):
+        try:
+            authenticated = admin is not None and password_hasher.check_password(admin, password)
+        except PasswordHasherBusy:
+            return password_hasher_busy()
+
+        if authenticated:
+            # Keeps the password if it was rehashed with the current work factor.
+            db.session.commit()
             session['admin_id'] = admin.id
             return admin.to_dict(), 200
         
@@ -77,9 +224,13 @@ class SignUp(Resource):
         if Admin.query.filter_by(email=email).first():
             return {'error': 'Email already exists'}, 400
         
+        admin = Admin(email=email)
+        try:
+            password_hasher.set_password(admin, password)
+        except PasswordHasherBusy:
+            return password_hasher_busy()
+
         try:
-            admin = Admin(email=email)
-            admin.password_hash = password
             db.session.add(admin)
             db.session.commit()
             
@@ -94,294 +245,504 @@ class Logout(Resource):
         return {'message': 'Successfully logged out'}, 204
     
 class CheckSession(Resource):
+    @login_required
     def get(self):
-        admin = Admin.query.filter_by(id=session.get('admin_id')).first()
-
-        if admin:
-            return admin.to_dict(), 200
-        
-        return {'error': 'Unauthorized'}, 401
+        return current_admin(), 200
     
 
-class Vehicles(Resource):
+class CacheStats(Resource):
+    @login_required
     def get(self):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
+        return response_cache.to_dict(), 200
 
-        vehicles_list = []
-        all_vehicles = Vehicle.query.all()
 
-        for vehicle in all_vehicles:
-            try:
-                vehicle_dict = vehicle.to_dict(rules=(
-                    '-admin.vehicles', 
-                    '-driver.vehicle', 
-                    '-trips.vehicle', 
-                    '-maintenance_records.vehicle', 
-                    '-charging_sessions.vehicle', 
-
-                    '-trips.driver.trips', 
-                    '-trips.driver.vehicle',
-                    '-trips.route.trips', 
-                ))
-                vehicles_list.append(vehicle_dict)
-
-            except RecursionError:
-                print(f"Warning: RecursionError encountered for Vehicle ID: {vehicle.id}. Skipping.")
-                vehicles_list.append({"error": "Serialization failed due to recursion", "vehicle_id": vehicle.id})
-            except Exception as e:
-                print(f"Error serializing Vehicle ID: {vehicle.id}. Error: {e}")
-                vehicles_list.append({"error": f"Serialization failed: {e}", "vehicle_id": vehicle.id})
-
-        return vehicles_list, 200
-    
-class VehicleByID(Resource):
-    def get(self, id):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
+class PoolStats(Resource):
+    @login_required
+    def get(self):
+        return pool_stats(), 200
 
-        vehicle = Vehicle.query.filter_by(id=id).first()
 
-        if not vehicle:
-            return {"error": "Vehicle not found"}, 404
-        
-        try:
-            vehicle_dict = vehicle.to_dict(rules=(
-                '-admin.vehicles', 
-                '-driver.vehicle', 
-                '-trips.vehicle',
-                '-trips.driver.vehicle',
-                '-trips.route.trips', 
-                '-maintenance_records.vehicle', 
-                '-charging_sessions.vehicle',
-            ))
-            return vehicle_dict, 200
-        except Exception as e:
-            return handle_serialization_error(e, "Vehicle", id), 500
-        
-class Drivers(Resource):
+class ReplicaStats(Resource):
+    @login_required
+    def get(self):
+        return replica_stats(), 200
+
+
+class Metrics(Resource):
+    # Scraped without a session; set METRICS_TOKEN unless the endpoint is
+    # only reachable from the internal network.
     def get(self):
-        admin_id = session.get('admin_id')
-        if not admin_id:
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
             return {'error': 'Unauthorized'}, 401
+        return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ModelCollection(Resource):
+    """Paginated (or streamed) list of `model`, serialized with `include` by
+    default, narrowed by the request args named in `filters` and ordered by
+    the keyset `keys`. With `?since=` only the changes after that version are
+    listed, in change order. With `?ids=` only the rows with those ids are
+    returned, keyed by id."""
 
-        drivers_list = []
-        all_drivers = Driver.query.all()
+    model = None
+    keys = ()
+    include = ()
+    filters = {}
 
-        for driver in all_drivers:
+    @login_required
+    def get(self):
+        if 'ids' in request.args:
             try:
-                driver_dict = driver.to_dict(rules=(
-                    '-vehicle.driver', 
-                    '-trips.driver',
-                ))
-                drivers_list.append(driver_dict)
-            except Exception as e:
-                drivers_list.append(handle_serialization_error(e, "Driver", driver.id))
-
-        return drivers_list, 200
-    
-class DriverByID(Resource):
-    def get(self, id):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
+                ids = parse_ids(request.args['ids'])
+            except FilterError as e:
+                return {'error': str(e)}, 400
+            return self.fetch_ids(ids)
 
-        driver = Driver.query.filter_by(id=id).first()
+        model_name = self.model.__name__
 
-        if not driver:
-            return {"error": "Driver not found"}, 404
-        
         try:
-            driver_dict = driver.to_dict(rules=(
-                '-vehicle.driver', 
-                '-trips.driver',
-                '-trips.driver',
-                '-trips.vehicle.driver',
-            ))
-            return driver_dict, 200
-        except Exception as e:
-            return handle_serialization_error(e, "Driver", id), 500
-        
-class ChargingSessions(Resource):
-    def get(self):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
+            since = parse_since()
+            if since is not None and request.args.get('include'):
+                raise ChangesError('since cannot be combined with include')
+            # Changes are tracked per table, so the feed only carries each
+            # row's own columns; sync related collections on their own.
+            include, fields = parse_fieldset(self.model, self.include if since is None else ())
+            keys = self.keys if since is None else change_keys(self.model)
+
+            query = self.model.query.options(*loader_plan(self.model, include, self.load_fields(fields, keys)))
+            query = apply_filters(query, self.filters)
+
+            # NDJSON is chosen by the Accept header rather than the URL, so
+            # the representation is part of the ETag.
+            tables = resource_tables(self.model, include)
+            validators = Validators(tables, scope=f'{request.full_path}|{representation()}', vary=('Accept',))
+            if validators.not_modified():
+                return validators.not_modified_response()
+
+            if wants_stream():
+                if since is not None:
+                    raise ChangesError('since cannot be combined with streaming')
+                rows = stream_query(query, *keys)
+                response = stream_response(serialize_rows(rows, include, fields, model_name))
+                response.headers.update(validators.headers())
+                return response
+
+            cached = response_cache.get(validators.etag)
+            if cached is not None:
+                return cached, 200, validators.headers()
+
+            if since is None:
+                rows, next_cursor = paginate(query, *keys)
+            else:
+                rows, deleted, next_cursor, next_since = changes(query, self.model, since)
+        except (PaginationError, FieldsetError, FilterError, ChangesError) as e:
+            return {'error': str(e)}, 400
 
-        charging_sessions_list = []
-        all_charging_sessions = ChargingSession.query.all()
+        payload = {'data': list(serialize_rows(rows, include, fields, model_name)), 'next_cursor': next_cursor}
+        if since is not None:
+            payload.update(deleted=deleted, next_since=next_since)
+        response_cache.set(validators.etag, tables, payload)
+        return payload, 200, validators.headers()
 
-        for charging_session in all_charging_sessions:
-            try:
-                charging_session_dict = charging_session.to_dict(rules=(
-                    '-vehicle.charging_sessions',
-                ))
-                charging_sessions_list.append(charging_session_dict)
-            except Exception as e:
-                charging_sessions_list.append(handle_serialization_error(e, "ChargingSession", charging_session.id))
-
-        return charging_sessions_list, 200
-    
-class ChargingSessionByID(Resource):
-    def get(self, id):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
+    def fetch_ids(self, ids):
+        """The rows with `ids` that match the filters, read with one IN query
+        plus the eager loads of `include`, keyed by id in the order asked
+        for, and the ids that were not found."""
+        model_name = self.model.__name__
 
-        charging_session = ChargingSession.query.filter_by(id=id).first()
+        try:
+            include, fields = parse_fieldset(self.model, self.include)
+            if parse_since() is not None or wants_stream() or 'cursor' in request.args:
+                raise FilterError('ids cannot be combined with since, stream or cursor')
 
-        if not charging_session:
-            return {"error": "ChargingSession not found"}, 404
+            query = self.model.query.options(*loader_plan(self.model, include, self.load_fields(fields, (self.model.id,))))
+            query = apply_filters(query, self.filters)
+        except (FieldsetError, FilterError, ChangesError) as e:
+            return {'error': str(e)}, 400
 
+        # The ids are not in the URL when they were POSTed.
+        tables = resource_tables(self.model, include)
+        validators = Validators(tables, scope=f"{request.full_path}|{','.join(map(str, ids))}")
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        cached = response_cache.get(validators.etag)
+        if cached is not None:
+            return cached, 200, validators.headers()
+
+        rows = query.filter(self.model.id.in_(ids)).all()
+        found = {row.id: data for row, data in zip(rows, serialize_rows(rows, include, fields, model_name))}
+        payload = {
+            'data': {str(id): found[id] for id in ids if id in found},
+            'missing': [id for id in ids if id not in found],
+        }
+        response_cache.set(validators.etag, tables, payload)
+        return payload, 200, validators.headers()
+
+    def load_fields(self, fields, keys):
+        # The keyset columns are needed for the next cursor even when the
+        # client did not ask for them.
+        if not any('.' not in field for field in fields):
+            return fields
+        key_fields = {pagination_key(key).key for key in keys}
+        return tuple(sorted(set(fields) | key_fields))
+
+
+class BatchFetch(Resource):
+    """`?ids=` on `collection` for lists too long for a URL: POST the ids as
+    {"ids": [...]} and keep any other args in the query string."""
+
+    collection = None
+
+    @login_required
+    def post(self):
+        body = request.get_json(silent=True)
+        ids = body.get('ids') if isinstance(body, dict) else None
         try:
-            session_dict = charging_session.to_dict(rules=(
-                '-vehicle.charging_sessions',
-            ))
-            return session_dict, 200
-        except Exception as e:
-            return handle_serialization_error(e, "ChargingSession", id), 500
+            # parse_ids also reads the comma-separated `ids` arg; a body
+            # must send a list.
+            ids = parse_ids(ids if isinstance(ids, list) else None)
+        except FilterError as e:
+            return {'error': str(e)}, 400
+        return self.collection().fetch_ids(ids)
 
-class MaintenanceRecords(Resource):
-    def get(self):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
 
-        records_list = []
-        all_records = MaintenanceRecord.query.all()
+class ModelByID(Resource):
+    """A single `model` by primary key, serialized with `include` by default."""
 
-        for record in all_records:
-            try:
-                record_dict = record.to_dict(rules=(
-                    '-vehicle.maintenance_records',
-                ))
-                records_list.append(record_dict)
-            except Exception as e:
-                records_list.append(handle_serialization_error(e, "MaintenanceRecord", record.id))
-
-        return records_list, 200
-    
-class MaintenanceRecordsByID(Resource):
+    model = None
+    include = ()
+
+    @login_required
     def get(self, id):
-        admin_id = session.get('admin_id')
-        if not admin_id:
-            return {'error': 'Unauthorized'}, 401
+        model_name = self.model.__name__
+
+        try:
+            include, fields = parse_fieldset(self.model, self.include)
+        except FieldsetError as e:
+            return {'error': str(e)}, 400
 
-        record = MaintenanceRecord.query.filter_by(id=id).first()
+        tables = resource_tables(self.model, include)
+        validators = Validators(tables)
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        cached = response_cache.get(validators.etag)
+        if cached is not None:
+            return cached, 200, validators.headers()
+
+        record = self.model.query.options(*loader_plan(self.model, include, fields)).filter_by(id=id).first()
 
         if not record:
-            return {"error": "MaintenanceRecord not found"}, 404
+            return {"error": f"{model_name} not found"}, 404
 
         try:
-            record_dict = record.to_dict(rules=(
-                '-vehicle.maintenance_records',
-            ))
-            return record_dict, 200
+            with serialization_timer():
+                payload = record.to_dict(include=include, fields=fields)
         except Exception as e:
-            return handle_serialization_error(e, "MaintenanceRecord", id), 500
+            return handle_serialization_error(e, model_name, id), 500
 
-class Trips(Resource):
-    def get(self):
-        if not session.get('admin_id'):
-            return {'error': 'Unauthorized'}, 401
-        
-        trips_list = []
+        response_cache.set(validators.etag, tables, payload)
+        return payload, 200, validators.headers()
 
-        all_trips = Trip.query.order_by(Trip.start_time.desc()).all()
 
-        for trip in all_trips:
-            try:
-                trip_dict = trip.to_dict(rules = (
-                    "-vehicle.trips",
-                    "-driver.trips",
-                    "-route.trips",
-                    "-vehicle.driver.vehicle",
-                    "-driver.vehicle.driver"
-                ))
-                trips_list.append(trip_dict)
-            except Exception as e:
-                trips_list.append(handle_serialization_error(e, "Trip", trip.id))
-
-        return trips_list, 200
-    
-class TripByID(Resource):
-    def get(self, id):
-        if not session.get('admin_id'):
-            return {'error': 'Unauthorized'}, 401
+class Vehicles(ModelCollection):
+    model = Vehicle
+    keys = (Vehicle.id,)
+    include = VEHICLE_INCLUDE
 
-        trip = Trip.query.filter_by(id=id).first()
+class VehicleByID(ModelByID):
+    model = Vehicle
+    include = VEHICLE_INCLUDE
 
-        if not trip:
-            return {"error": "Trip not found"}, 404
+class VehiclesBatch(BatchFetch):
+    collection = Vehicles
 
+class VehicleStatuses(Resource):
+    @login_required
+    def patch(self):
         try:
-            trip_dict = trip.to_dict(rules = (
-                "-vehicle.trips",
-                "-driver.trips",
-                "-route.trips",
-            ))
-            return trip_dict, 200
-        except Exception as e:
-            return handle_serialization_error(e, "Trip", id), 500
-        
-class Routes(Resource):
+            changes = parse_status_changes(request.get_json(silent=True))
+        except StatusUpdateError as e:
+            return {'error': str(e)}, 400
+
+        result = apply_status_changes(changes)
+        db.session.commit()
+        return result, 200
+
+class Drivers(ModelCollection):
+    model = Driver
+    keys = (Driver.id,)
+    include = DRIVER_INCLUDE
+
+class DriverByID(ModelByID):
+    model = Driver
+    include = DRIVER_INCLUDE
+
+class DriversBatch(BatchFetch):
+    collection = Drivers
+
+class ChargingSessions(ModelCollection):
+    model = ChargingSession
+    keys = (ChargingSession.id,)
+    include = CHARGING_SESSION_INCLUDE
+    filters = {
+        'vehicle_id': equals(ChargingSession.vehicle_id),
+        'start_time_from': on_or_after(ChargingSession.start_time),
+        'start_time_to': before(ChargingSession.start_time),
+        'ongoing': is_null(ChargingSession.end_time),
+    }
+
+class ChargingSessionByID(ModelByID):
+    model = ChargingSession
+    include = CHARGING_SESSION_INCLUDE
+
+class ChargingSessionsBatch(BatchFetch):
+    collection = ChargingSessions
+
+class MaintenanceRecords(ModelCollection):
+    model = MaintenanceRecord
+    keys = (MaintenanceRecord.id,)
+    include = MAINTENANCE_RECORD_INCLUDE
+    filters = {
+        'vehicle_id': equals(MaintenanceRecord.vehicle_id),
+        'record_date_from': on_or_after(MaintenanceRecord.record_date),
+        'record_date_to': before(MaintenanceRecord.record_date),
+        'resolved': flag(MaintenanceRecord.resolved),
+    }
+
+class MaintenanceRecordsByID(ModelByID):
+    model = MaintenanceRecord
+    include = MAINTENANCE_RECORD_INCLUDE
+
+class MaintenanceRecordsBatch(BatchFetch):
+    collection = MaintenanceRecords
+
+class Trips(ModelCollection):
+    model = Trip
+    keys = (Trip.start_time.desc(), Trip.id.desc())
+    include = TRIP_INCLUDE
+    filters = {
+        'vehicle_id': equals(Trip.vehicle_id),
+        'driver_id': equals(Trip.driver_id),
+        'route_id': equals(Trip.route_id),
+        'start_time_from': on_or_after(Trip.start_time),
+        'start_time_to': before(Trip.start_time),
+        'completed': flag(Trip.completed),
+        'ongoing': is_null(Trip.end_time),
+    }
+
+class TripByID(ModelByID):
+    model = Trip
+    include = TRIP_INCLUDE
+
+class TripsBatch(BatchFetch):
+    collection = Trips
+
+class BulkIngest(Resource):
+    """Bulk insert of `spec.model` rows, streamed as NDJSON or sent as a
+    JSON array, with a report of the rows that were rejected."""
+
+    spec = None
+
+    @login_required
+    def post(self):
+        try:
+            chunk_size = parse_chunk_size()
+            records = read_records()
+        except (IngestError, FilterError) as e:
+            return {'error': str(e)}, 400
+
+        return ingest(self.spec, records, chunk_size), 200
+
+class TripsBulk(BulkIngest):
+    spec = TRIP_SPEC
+
+class ChargingSessionsBulk(BulkIngest):
+    spec = CHARGING_SESSION_SPEC
+
+class Routes(ModelCollection):
+    model = Route
+    keys = (Route.name, Route.id)
+    include = ROUTE_INCLUDE
+
+class RouteByID(ModelByID):
+    model = Route
+    include = ROUTE_DETAIL_INCLUDE
+
+class RoutesBatch(BatchFetch):
+    collection = Routes
+
+class RoutesNearest(Resource):
+    @login_required
     def get(self):
-        if not session.get('admin_id'):
-            return {'error': 'Unauthorized'}, 401
-        
-        routes_list = []
-        all_routes = Route.query.order_by(Route.name).all()
+        try:
+            lat, lon, k = parse_nearest_args()
+        except FilterError as e:
+            return {'error': str(e)}, 400
 
-        for route_obj in all_routes:
-            try:
-                route_dict = route_obj.to_dict(rules=('-trips',))
-                routes_list.append(route_dict)
-            except Exception as e:
-                routes_list.append(handle_serialization_error(e, "Route", route_obj.id))
+        validators = Validators(ROUTE_TABLES)
+        if validators.not_modified():
+            return validators.not_modified_response()
 
-        return routes_list, 200
+        routes = route_index.grid(validators.versions).nearest(lat, lon, k)
+        return {'data': routes}, 200, validators.headers()
 
-class RouteByID(Resource):
-    def get(self, id):
-        if not session.get('admin_id'):
-            return {'error': 'Unauthorized'}, 401
+class RoutesWithin(Resource):
+    @login_required
+    def get(self):
+        try:
+            *bbox, limit = parse_within_args()
+        except FilterError as e:
+            return {'error': str(e)}, 400
 
-        route = Route.query.filter_by(id=id)
+        validators = Validators(ROUTE_TABLES)
+        if validators.not_modified():
+            return validators.not_modified_response()
 
-        if not route:
-            return {"error": "Route not found"}, 404
-        
+        routes, count = route_index.grid(validators.versions).within(*bbox, limit)
+        return {'data': routes, 'count': count}, 200, validators.headers()
+
+
+class ReportResource(Resource):
+    """A report over `tables`, built by `build` from the arguments `parse`
+    reads from the request args, and served with validators and the
+    response cache."""
+
+    tables = frozenset()
+
+    def parse(self):
+        """The report's arguments; raises FilterError for bad request args."""
+        return ()
+
+    def build(self, validators, *args):
+        raise NotImplementedError
+
+    @login_required
+    def get(self):
         try:
-            route_dict = route.to_dict(rules=(
-                "-trips.route",
-                "-trips.vehicle.trips",
-                "-trips.driver.trips",
-            ))
-            return route_dict, 200
-        except Exception as e:
-            return handle_serialization_error(e, "Route", id), 500
-    
+            args = self.parse()
+        except FilterError as e:
+            return {'error': str(e)}, 400
+
+        # Defaults such as a window ending now are resolved by `parse`, not
+        # spelled out in the URL, so the parsed arguments are part of the ETag.
+        validators = Validators(self.tables, scope='|'.join([request.full_path, *map(str, args)]))
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        cached = response_cache.get(validators.etag)
+        if cached is not None:
+            return cached, 200, validators.headers()
+
+        report = self.build(validators, *args)
+        response_cache.set(validators.etag, self.tables, report)
+        return report, 200, validators.headers()
+
+
+class EnergyAnalytics(ReportResource):
+    tables = ENERGY_TABLES
+
+    def parse(self):
+        return parse_energy_args()
+
+    def build(self, validators, granularity, start, end, vehicle_id):
+        return energy_report(granularity, start, end, vehicle_id)
+
+
+class UtilizationAnalytics(ReportResource):
+    tables = UTILIZATION_TABLES
+
+    def parse(self):
+        return parse_utilization_args()
+
+    def build(self, validators, start, end):
+        return utilization_report(start, end)
+
+
+class ChargingLoadAnalytics(ReportResource):
+    tables = CHARGING_LOAD_TABLES
+
+    def parse(self):
+        return parse_load_args()
+
+    def build(self, validators, start, end, resolution):
+        return load_report(start, end, resolution)
+
+
+class Availability(ReportResource):
+    tables = AVAILABILITY_TABLES
+
+    def parse(self):
+        return parse_availability_args()
+
+    def build(self, validators, start, end):
+        # The trip index answers as of the versions the ETag was made from.
+        return availability(validators.versions, start, end)
+
+
+class FleetDashboard(Resource):
+    @login_required
+    def get(self):
+        try:
+            limit = parse_dashboard_args()
+        except FilterError as e:
+            return {'error': str(e)}, 400
 
+        cached = dashboard.cached(limit)
+        if cached is not None:
+            validators, payload = cached
+            if validators.not_modified():
+                return validators.not_modified_response()
+            return payload, 200, validators.headers()
+
+        validators = Validators(DASHBOARD_TABLES)
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        payload = dashboard.build(limit, validators)
+        return payload, 200, validators.headers()
+
+def register_resources(api):
+    api.add_resource(Vehicles, '/vehicles')
+    api.add_resource(VehiclesBatch, '/vehicles/batch')
+    api.add_resource(VehicleByID, '/vehicles/<int:id>')
+    api.add_resource(VehicleStatuses, '/vehicles/status')
+    api.add_resource(Drivers, '/drivers')
+    api.add_resource(DriversBatch, '/drivers/batch')
+    api.add_resource(DriverByID, '/drivers/<int:id>')
+    api.add_resource(ChargingSessions, '/charging-sessions')
+    api.add_resource(ChargingSessionsBatch, '/charging-sessions/batch')
+    api.add_resource(ChargingSessionByID, '/charging-sessions/<int:id>')
+    api.add_resource(ChargingSessionsBulk, '/charging-sessions/bulk')
+    api.add_resource(MaintenanceRecords, '/maintenance-records')
+    api.add_resource(MaintenanceRecordsBatch, '/maintenance-records/batch')
+    api.add_resource(MaintenanceRecordsByID, '/maintenance-records/<int:id>')
+    api.add_resource(Login, '/login')
+    api.add_resource(Logout, '/logout')
+    api.add_resource(CheckSession, '/check-session')
+    api.add_resource(ClearSession, '/clear-session')
+    api.add_resource(CacheStats, '/cache-stats')
+    api.add_resource(PoolStats, '/pool-stats')
+    api.add_resource(ReplicaStats, '/replica-stats')
+    api.add_resource(Metrics, '/metrics')
+    api.add_resource(SignUp, '/signup')
+    api.add_resource(Trips, '/trips')
+    api.add_resource(TripsBatch, '/trips/batch')
+    api.add_resource(TripByID, '/trips/<int:id>')
+    api.add_resource(TripsBulk, '/trips/bulk')
+    api.add_resource(Routes, '/routes')
+    api.add_resource(RoutesBatch, '/routes/batch')
+    api.add_resource(RouteByID, '/routes/<int:id>')
+    api.add_resource(RoutesNearest, '/routes/nearest')
+    api.add_resource(RoutesWithin, '/routes/within')
+    api.add_resource(Availability, '/availability')
+    api.add_resource(FleetDashboard, '/dashboard')
+    api.add_resource(EnergyAnalytics, '/analytics/energy')
+    api.add_resource(UtilizationAnalytics, '/analytics/utilization')
+    api.add_resource(ChargingLoadAnalytics, '/analytics/charging-load')
 
-api.add_resource(Vehicles, '/vehicles')
-api.add_resource(VehicleByID, '/vehicles/<int:id>')
-api.add_resource(Drivers, '/drivers')
-api.add_resource(DriverByID, '/drivers/<int:id>')
-api.add_resource(ChargingSessions, '/charging-sessions')
-api.add_resource(ChargingSessionByID, '/charging-sessions/<int:id>')
-api.add_resource(MaintenanceRecords, '/maintenance-records')
-api.add_resource(MaintenanceRecordsByID, '/maintenance-records/<int:id>')
-api.add_resource(Login, '/login')
-api.add_resource(Logout, '/logout')
-api.add_resource(CheckSession, '/check-session')
-api.add_resource(ClearSession, '/clear-session')
-api.add_resource(SignUp, '/signup')
-api.add_resource(Trips, '/trips')
-api.add_resource(TripByID, '/trips/<int:id>')
-api.add_resource(Routes, '/routes')
-api.add_resource(RouteByID, '/routes/<int:id>')
 
 if __name__ == '__main__':
-    app.run(port=5555, debug=True)
\ No newline at end of file
+    create_app().run(port=5555, debug=True)
\ No newline at end of file
@@ -0,0 +1,27 @@
+from flask import current_app, has_app_context
+from werkzeug.local import LocalProxy
+
+
+def app_local(name, factory):
+    """A proxy to `factory(app)` for the current app, made the first time it
+    is used in that app and kept in `app.extensions[name]`.
+
+    Apps built by create_app therefore share no caches, pools or indexes,
+    and an app only pays for the parts it actually uses.
+    """
+    def get():
+        app = current_app._get_current_object()
+        state = app.extensions.get(name)
+        if state is None:
+            state = app.extensions.setdefault(name, factory(app))
+        return state
+
+    return LocalProxy(get)
+
+
+def app_local_state(name):
+    """The state of the app_local `name` in the current app, or None if it
+    has not been used there yet (or there is no app context)."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(name)
@@ -0,0 +1,107 @@
+import collections
+import functools
+import threading
+import time
+
+from flask import g, session
+
+from models import db, Admin
+from app_state import app_local, app_local_state
+from versions import commit_listeners
+
+
+ADMIN_TABLE = Admin.__table__.name
+
+
+class IdentityCache:
+    """Serialized admins by id, so that an authenticated request does not
+    read the admins table. An LRU bounded by entry count, whose entries
+    expire after `ttl` seconds.
+
+    Commits in this process that change the admins table clear it at once;
+    changes made by other workers are seen once the entry expires.
+    """
+
+    def __init__(self, app=None, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('IDENTITY_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', self.ttl)
+
+    def get(self, admin_id):
+        with self._lock:
+            entry = self._entries.get(admin_id)
+            if entry is None:
+                return None
+            expires_at, admin = entry
+            if expires_at < time.monotonic():
+                del self._entries[admin_id]
+                return None
+            self._entries.move_to_end(admin_id)
+            return admin
+
+    def set(self, admin_id, admin):
+        with self._lock:
+            self._entries[admin_id] = (time.monotonic() + self.ttl, admin)
+            self._entries.move_to_end(admin_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_tables(self, tables):
+        if ADMIN_TABLE in tables:
+            self.clear()
+
+
+identity_cache = app_local('identity_cache', IdentityCache)
+
+
+def _invalidate_tables(tables):
+    cache = app_local_state('identity_cache')
+    if cache is not None:
+        cache.invalidate_tables(tables)
+
+
+commit_listeners.append(_invalidate_tables)
+
+
+def _resolve(admin_id):
+    if not admin_id:
+        return None
+
+    admin = identity_cache.get(admin_id)
+    if admin is None:
+        # From the primary: an admin who has just signed up, on this or any
+        # other client, may not be on the read replicas yet.
+        record = db.session.get(Admin, admin_id, bind_arguments={'bind': db.engine})
+        if record is None:
+            return None
+        admin = record.to_dict()
+        identity_cache.set(admin_id, admin)
+    return admin
+
+
+def current_admin():
+    """The signed-in admin, serialized, or None. Resolved once per request."""
+    if 'admin' not in g:
+        g.admin = _resolve(session.get('admin_id'))
+    return g.admin
+
+
+def login_required(method):
+    """Answer 401 unless the session belongs to an existing admin."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if current_admin() is None:
+            return {'error': 'Unauthorized'}, 401
+        return method(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,194 @@
+import bisect
+import collections
+import datetime
+import itertools
+import threading
+
+from flask import request
+from sqlalchemy import select
+
+from models import db, Driver, Trip, Tombstone, Vehicle
+from filters import FilterError, check_args, parse_datetime, local_time
+from app_state import app_local
+
+
+TRIP_TABLE = Trip.__table__.name
+AVAILABILITY_TABLES = frozenset({TRIP_TABLE, Driver.__table__.name, Vehicle.__table__.name})
+
+# Vehicles in these states are never offered, whatever their trips.
+UNAVAILABLE_STATUSES = ('maintenance',)
+
+# The end of an ongoing trip.
+OPEN_END = datetime.datetime.max
+
+
+class Intervals:
+    """The trips of one driver or vehicle as [start, end) intervals sorted by
+    start, with the running maximum of their ends, so that whether any of
+    them overlaps a window is a single bisect."""
+
+    __slots__ = ('starts', 'ends', 'trip_ids', 'reach')
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.trip_ids = [trip_id for _, _, trip_id in intervals]
+        self.reach = list(itertools.accumulate(self.ends, max))
+
+    def _update_reach(self, i):
+        del self.reach[i:]
+        previous = self.reach[-1] if self.reach else None
+        for end in self.ends[i:]:
+            previous = end if previous is None else max(previous, end)
+            self.reach.append(previous)
+
+    def add(self, trip_id, start, end):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.trip_ids.insert(i, trip_id)
+        self._update_reach(i)
+
+    def remove(self, trip_id):
+        i = self.trip_ids.index(trip_id)
+        del self.starts[i], self.ends[i], self.trip_ids[i]
+        self._update_reach(i)
+
+    def overlaps(self, start, end):
+        # Of the trips starting before `end`, does any end after `start`?
+        i = bisect.bisect_left(self.starts, end)
+        return i > 0 and self.reach[i - 1] > start
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class AvailabilityIndex:
+    """Trip intervals per vehicle and per driver, kept in memory.
+
+    The index is built from the trips table on first use. After that it
+    follows the table's change feed: before answering, it applies the trips
+    changed and deleted since the version it last saw, so writes made by
+    any worker are picked up without reading the whole table again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._trips = {}
+        self._vehicles = collections.defaultdict(Intervals)
+        self._drivers = collections.defaultdict(Intervals)
+
+    def _add(self, trip_id, vehicle_id, driver_id, start, end):
+        if start is None:
+            return
+        end = OPEN_END if end is None else end
+        self._trips[trip_id] = (vehicle_id, driver_id)
+        self._vehicles[vehicle_id].add(trip_id, start, end)
+        self._drivers[driver_id].add(trip_id, start, end)
+
+    def _remove(self, trip_id):
+        owners = self._trips.pop(trip_id, None)
+        if owners is None:
+            return
+        for intervals, owner in zip((self._vehicles, self._drivers), owners):
+            intervals[owner].remove(trip_id)
+            if not intervals[owner]:
+                del intervals[owner]
+
+    def _build(self, connection, version):
+        rows = connection.execute(
+            select(Trip.id, Trip.vehicle_id, Trip.driver_id, Trip.start_time, Trip.end_time)
+            .where(Trip.start_time.isnot(None), Trip.change_seq <= version)
+        ).all()
+
+        by_vehicle = collections.defaultdict(list)
+        by_driver = collections.defaultdict(list)
+        self._trips = {}
+        for trip_id, vehicle_id, driver_id, start, end in rows:
+            end = OPEN_END if end is None else end
+            self._trips[trip_id] = (vehicle_id, driver_id)
+            by_vehicle[vehicle_id].append((start, end, trip_id))
+            by_driver[driver_id].append((start, end, trip_id))
+
+        self._vehicles = collections.defaultdict(Intervals, {k: Intervals(v) for k, v in by_vehicle.items()})
+        self._drivers = collections.defaultdict(Intervals, {k: Intervals(v) for k, v in by_driver.items()})
+
+    def _catch_up(self, connection, version):
+        # Deletions first: a changed row is always the trip's latest state.
+        deleted = connection.execute(
+            select(Tombstone.row_id).where(
+                Tombstone.table_name == TRIP_TABLE,
+                Tombstone.version > self._version,
+                Tombstone.version <= version,
+            )
+        ).scalars()
+        for trip_id in deleted:
+            self._remove(trip_id)
+
+        changed = connection.execute(
+            select(Trip.id, Trip.vehicle_id, Trip.driver_id, Trip.start_time, Trip.end_time)
+            .where(Trip.change_seq > self._version, Trip.change_seq <= version)
+        )
+        for trip_id, vehicle_id, driver_id, start, end in changed:
+            self._remove(trip_id)
+            self._add(trip_id, vehicle_id, driver_id, start, end)
+
+    def _refresh(self, versions):
+        # Every version up to the one Validators read is committed; newer
+        # ones are picked up by a later request.
+        version, _ = versions.get(TRIP_TABLE, (0, None))
+        if self._version is not None and version <= self._version:
+            return
+
+        connection = db.session.connection()
+        if self._version is None:
+            self._build(connection, version)
+        else:
+            self._catch_up(connection, version)
+        self._version = version
+
+    def busy(self, versions, start, end, vehicle_ids, driver_ids):
+        """The ids among `vehicle_ids` and `driver_ids` with a trip
+        overlapping [start, end), as of `versions` (read by Validators)."""
+        with self._lock:
+            self._refresh(versions)
+            vehicles = {i for i in vehicle_ids if i in self._vehicles and self._vehicles[i].overlaps(start, end)}
+            drivers = {i for i in driver_ids if i in self._drivers and self._drivers[i].overlaps(start, end)}
+        return vehicles, drivers
+
+
+availability_index = app_local('availability_index', lambda app: AvailabilityIndex())
+
+
+def parse_availability_args():
+    """The (start, end) of the requested window; both are required."""
+    check_args({'from', 'to'})
+
+    window = []
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if not value:
+            raise FilterError(f'{name} is required')
+        window.append(local_time(parse_datetime(value)))
+
+    start, end = window
+    if start >= end:
+        raise FilterError('from must be before to')
+    return start, end
+
+
+def availability(versions, start, end):
+    """The available drivers and the vehicles not in UNAVAILABLE_STATUSES
+    that have no trip overlapping [start, end)."""
+    drivers = Driver.query.filter(Driver.is_available.isnot(False)).order_by(Driver.id).all()
+    vehicles = Vehicle.query.filter(Vehicle.current_status.notin_(UNAVAILABLE_STATUSES)).order_by(Vehicle.id).all()
+
+    busy_vehicles, busy_drivers = availability_index.busy(
+        versions, start, end, [v.id for v in vehicles], [d.id for d in drivers]
+    )
+    return {
+        'drivers': [d.to_dict(include=()) for d in drivers if d.id not in busy_drivers],
+        'vehicles': [v.to_dict(include=()) for v in vehicles if v.id not in busy_vehicles],
+    }
@@ -0,0 +1,131 @@
+"""Compare query plans and timings for the main access paths with and without
+the secondary indexes declared on the models.
+
+Builds a throwaway SQLite database with synthetic data, so it can be run
+anywhere:
+
+    python benchmark_indexes.py [--trips 200000]
+"""
+import argparse
+import datetime
+import random
+import time
+
+from sqlalchemy import create_engine, insert, select, text
+
+from models import db, Trip, ChargingSession, MaintenanceRecord
+
+TABLES = [db.metadata.tables[name] for name in ('admins', 'routes', 'vehicles', 'drivers', 'trips', 'charging_sessions', 'maintenance_records')]
+INDEXED_TABLES = ('trips', 'charging_sessions', 'maintenance_records')
+
+NUM_VEHICLES = 500
+NUM_DRIVERS = 600
+NUM_ROUTES = 50
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def populate(engine, num_trips):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(db.metadata.tables['routes']), [
+            {'id': i, 'name': f'Route {i}', 'start_latitude': 0, 'start_longitude': 0, 'end_latitude': 0, 'end_longitude': 0}
+            for i in range(1, NUM_ROUTES + 1)
+        ])
+        conn.execute(insert(db.metadata.tables['vehicles']), [
+            {'id': i, 'number_plate': f'KAA {i:03d}', 'current_status': 'idle'} for i in range(1, NUM_VEHICLES + 1)
+        ])
+        conn.execute(insert(db.metadata.tables['drivers']), [
+            {'id': i, 'name': f'Driver {i}', 'driving_license_number': i, 'national_id_number': i,
+             'phone': str(i), 'email': f'{i}@example.com'}
+            for i in range(1, NUM_DRIVERS + 1)
+        ])
+
+        trips = []
+        for i in range(1, num_trips + 1):
+            start = EPOCH + datetime.timedelta(minutes=rng.randrange(60 * 24 * 365))
+            trips.append({
+                'id': i, 'start_time': start, 'end_time': start + datetime.timedelta(minutes=90),
+                'completed': True, 'vehicle_id': rng.randint(1, NUM_VEHICLES),
+                'driver_id': rng.randint(1, NUM_DRIVERS), 'route_id': rng.randint(1, NUM_ROUTES),
+            })
+        conn.execute(insert(Trip.__table__), trips)
+
+        sessions = []
+        for i in range(1, num_trips // 2 + 1):
+            start = EPOCH + datetime.timedelta(minutes=rng.randrange(60 * 24 * 365))
+            ongoing = rng.random() < 0.01
+            sessions.append({
+                'id': i, 'start_time': start, 'end_time': None if ongoing else start + datetime.timedelta(hours=2),
+                'energy_kwh': 100.0, 'vehicle_id': rng.randint(1, NUM_VEHICLES),
+            })
+        conn.execute(insert(ChargingSession.__table__), sessions)
+
+        records = []
+        for i in range(1, num_trips // 4 + 1):
+            records.append({
+                'id': i, 'description': 'Routine Inspection',
+                'record_date': EPOCH + datetime.timedelta(minutes=rng.randrange(60 * 24 * 365)),
+                'resolved': rng.random() < 0.95, 'vehicle_id': rng.randint(1, NUM_VEHICLES),
+            })
+        conn.execute(insert(MaintenanceRecord.__table__), records)
+
+
+def access_paths():
+    cursor_time = EPOCH + datetime.timedelta(days=180)
+    newest_first = (Trip.start_time.desc().nulls_last(), Trip.id.desc())
+    return [
+        ('trips: newest page', select(Trip).order_by(*newest_first).limit(50)),
+        ('trips: page after cursor', select(Trip).where(
+            Trip.start_time <= cursor_time,
+            (Trip.start_time < cursor_time) | (Trip.id < 1000),
+        ).order_by(*newest_first).limit(50)),
+        ('trips: by vehicle', select(Trip).where(Trip.vehicle_id == 7).order_by(*newest_first).limit(50)),
+        ('trips: selectin for 50 vehicles', select(Trip).where(Trip.vehicle_id.in_(range(1, 51)))),
+        ('charging: ongoing for vehicle', select(ChargingSession).where(
+            ChargingSession.vehicle_id == 7, ChargingSession.end_time.is_(None)).order_by(ChargingSession.id)),
+        ('charging: one week', select(ChargingSession).where(
+            ChargingSession.start_time >= cursor_time,
+            ChargingSession.start_time < cursor_time + datetime.timedelta(days=7)).order_by(ChargingSession.id).limit(50)),
+        ('maintenance: open for vehicle', select(MaintenanceRecord).where(
+            MaintenanceRecord.vehicle_id == 7, MaintenanceRecord.resolved.isnot(True)).order_by(MaintenanceRecord.id)),
+    ]
+
+
+def run(engine, label, repeat=20):
+    print(f'\n== {label} ==')
+    with engine.connect() as conn:
+        for name, stmt in access_paths():
+            sql = str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+            plan = [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(stmt).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+
+            print(f'{name:34} {elapsed:9.3f} ms  {"; ".join(plan)}')
+
+
+def indexes():
+    return [index for name in INDEXED_TABLES for index in db.metadata.tables[name].indexes]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trips', type=int, default=200_000)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=TABLES)
+    for index in indexes():
+        index.drop(engine)
+
+    print(f'Populating {args.trips} trips...')
+    populate(engine, args.trips)
+
+    run(engine, 'without secondary indexes')
+    for index in indexes():
+        index.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+    run(engine, 'with secondary indexes')
@@ -0,0 +1,208 @@
+import collections
+import json
+import threading
+import time
+
+from flask import request, session
+
+from app_state import app_local, app_local_state
+from versions import commit_listeners
+
+
+DEFAULT_BACKEND = 'memory'
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def to_dict(self):
+        with self._lock:
+            return {name: self.counts[name] for name in ('hits', 'misses', 'sets', 'evictions', 'expirations', 'invalidations')}
+
+
+class MemoryBackend:
+    """In-process LRU bounded by entry count, with a per-entry TTL.
+
+    Entries are tagged with the tables they were built from so that a commit
+    can drop exactly the entries it affects.
+    """
+
+    def __init__(self, stats, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.stats = stats
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._tags = collections.defaultdict(set)
+
+    def _remove(self, key):
+        _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._tags[table]
+            keys.discard(key)
+            if not keys:
+                del self._tags[table]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.stats.incr('expirations')
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tables):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tables, value)
+            for table in tables:
+                self._tags[table].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats.incr('evictions')
+
+    def invalidate_tables(self, tables):
+        with self._lock:
+            keys = set()
+            for table in tables:
+                keys |= self._tags.get(table, set())
+            for key in keys:
+                self._remove(key)
+        self.stats.incr('invalidations', len(keys))
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared backend for any Redis-compatible server. Requires the optional
+    `redis` package."""
+
+    PREFIX = 'fleet:response:'
+
+    def __init__(self, stats, url=None, ttl=DEFAULT_TTL, client=None):
+        # `client` stands in for a connection to `url`, e.g. in tests.
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RESPONSE_CACHE=redis requires the 'redis' package")
+            client = redis.Redis.from_url(url)
+
+        self.stats = stats
+        self.ttl = ttl
+        self.client = client
+
+    def _tag(self, table):
+        return f'{self.PREFIX}tag:{table}'
+
+    def get(self, key):
+        raw = self.client.get(self.PREFIX + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, tables):
+        pipe = self.client.pipeline()
+        pipe.set(self.PREFIX + key, json.dumps(value), ex=self.ttl)
+        for table in tables:
+            pipe.sadd(self._tag(table), key)
+            pipe.expire(self._tag(table), self.ttl)
+        pipe.execute()
+
+    def invalidate_tables(self, tables):
+        keys = set()
+        for table in tables:
+            keys |= {key.decode('utf-8') for key in self.client.smembers(self._tag(table))}
+        if keys:
+            self.client.delete(*[self.PREFIX + key for key in keys])
+        self.client.delete(*[self._tag(table) for table in tables])
+        self.stats.incr('invalidations', len(keys))
+
+    def size(self):
+        return None
+
+
+class ResponseCache:
+    """Cache of serialized read responses, keyed by endpoint, query args and
+    admin.
+
+    Each entry remembers the ETag it was built under. A hit is only served
+    while the ETag is unchanged, so entries never outlive a commit in any
+    worker; commits made in this process also evict affected entries eagerly.
+    """
+
+    def __init__(self, app=None):
+        self.stats = CacheStats()
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('RESPONSE_CACHE', DEFAULT_BACKEND)
+        ttl = app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+
+        if kind == 'memory':
+            max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+            self.backend = MemoryBackend(self.stats, max_entries=max_entries, ttl=ttl)
+        elif kind == 'redis':
+            self.backend = RedisBackend(self.stats, app.config['RESPONSE_CACHE_REDIS_URL'], ttl=ttl)
+        elif kind in ('none', None):
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE backend '{kind}'")
+
+    def invalidate_tables(self, tables):
+        if self.backend is not None:
+            self.backend.invalidate_tables(tables)
+
+    def key(self):
+        return f"{request.endpoint}|{session.get('admin_id')}|{request.full_path}"
+
+    def get(self, etag):
+        if self.backend is None:
+            return None
+
+        entry = self.backend.get(self.key())
+        if entry is not None and entry[0] == etag:
+            self.stats.incr('hits')
+            return entry[1]
+
+        self.stats.incr('misses')
+        return None
+
+    def set(self, etag, tables, payload):
+        if self.backend is None:
+            return
+        self.backend.set(self.key(), (etag, payload), tables)
+        self.stats.incr('sets')
+
+    def to_dict(self):
+        stats = self.stats.to_dict()
+        stats['backend'] = type(self.backend).__name__ if self.backend else None
+        stats['entries'] = self.backend.size() if self.backend else 0
+        return stats
+
+
+response_cache = app_local('response_cache', ResponseCache)
+
+
+def _invalidate_tables(tables):
+    cache = app_local_state('response_cache')
+    if cache is not None:
+        cache.invalidate_tables(tables)
+
+
+commit_listeners.append(_invalidate_tables)
@@ -0,0 +1,61 @@
+from flask import request
+from sqlalchemy import select
+
+from models import db, Tombstone
+from pagination import paginate, pagination_key, decode_cursor
+from versions import table_versions
+
+
+class ChangesError(ValueError):
+    pass
+
+
+def parse_since():
+    """The `since` request arg: the `next_since` of the client's last sync,
+    or 0 for a full sync. None when the arg is absent."""
+    value = request.args.get('since')
+    if value is None:
+        return None
+    try:
+        since = int(value)
+    except ValueError:
+        raise ChangesError('since must be an integer')
+    if since < 0:
+        raise ChangesError('since must not be negative')
+    return since
+
+
+def change_keys(model):
+    return (model.change_seq, model.id)
+
+
+def changes(query, model, since):
+    """The rows of `query` changed after version `since` and the ids of the
+    `model` rows deleted after it, a page at a time.
+
+    Changed rows are paginated in (change_seq, id) order with the `limit`
+    and `cursor` request args. Each page also reports the deletions up to
+    its last row's version, so every deletion is reported exactly once.
+    Returns (rows, deleted_ids, next_cursor, next_since); `next_since` is
+    only set on the last page.
+    """
+    table = model.__table__.name
+
+    # Read the current version first: every version up to it is committed,
+    # so stopping there never skips a change that becomes visible later.
+    current, _ = table_versions([table]).get(table, (0, None))
+
+    query = query.filter(model.change_seq > since, model.change_seq <= current)
+    rows, next_cursor = paginate(query, *change_keys(model))
+
+    cursor = request.args.get('cursor')
+    low = decode_cursor(cursor, [pagination_key(key) for key in change_keys(model)])[0] if cursor else since
+    high = rows[-1].change_seq if next_cursor else current
+
+    deleted = db.session.scalars(
+        select(Tombstone.row_id)
+        .where(Tombstone.table_name == table, Tombstone.version > low, Tombstone.version <= high)
+        .order_by(Tombstone.version, Tombstone.id)
+    ).all()
+
+    return rows, deleted, next_cursor, None if next_cursor else current
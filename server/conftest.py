@@ -0,0 +1,72 @@
+import datetime
+
+import pytest
+
+from app import create_app
+from models import db, Admin, Vehicle, Driver, Trip, Route, MaintenanceRecord, ChargingSession
+
+
+TEST_CONFIG = {
+    'SECRET_KEY': 'test',
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+}
+
+
+def seed(vehicles=3, trips_per_vehicle=4):
+    """A signed-up admin with a few of every other row. Returns the admin."""
+    admin = Admin(email='admin@example.com', _password_hash='x')
+    routes = [
+        Route(name=f'Route {i}', start_latitude=-1.28, start_longitude=36.81,
+              end_latitude=-1.10 - i / 100, end_longitude=37.01 + i / 100)
+        for i in range(2)
+    ]
+    db.session.add_all([admin, *routes])
+
+    start = datetime.datetime(2026, 2, 1, 8)
+    for i in range(vehicles):
+        vehicle = Vehicle(model=f'Model {i}', capacity=4, number_plate=f'KAA {i:03}A', admin=admin)
+        driver = Driver(name=f'Driver {i}', driving_license_number=1000 + i, national_id_number=2000 + i,
+                        phone=f'+25470000000{i}', email=f'driver{i}@example.com', vehicle=vehicle)
+        vehicle.maintenance_records = [
+            MaintenanceRecord(description='Brakes', record_date=start, resolved=False),
+        ]
+        vehicle.charging_sessions = [
+            ChargingSession(start_time=start + datetime.timedelta(days=day), energy_kwh=20,
+                            end_time=start + datetime.timedelta(days=day, hours=1))
+            for day in range(2)
+        ]
+        vehicle.trips = [
+            Trip(driver=driver, route=routes[j % 2], completed=True,
+                 start_time=start + datetime.timedelta(hours=j), end_time=start + datetime.timedelta(hours=j, minutes=30))
+            for j in range(trips_per_vehicle)
+        ]
+        db.session.add(vehicle)
+
+    db.session.commit()
+    return admin
+
+
+def build_app(config=None, **sizes):
+    """An app on a fresh in-memory database, seeded with `sizes` (see seed)."""
+    app = create_app({**TEST_CONFIG, **(config or {})})
+    with app.app_context():
+        db.create_all(bind_key=None)
+        seed(**sizes)
+    return app
+
+
+def signed_in(client, admin_id=1):
+    with client.session_transaction() as session:
+        session['admin_id'] = admin_id
+    return client
+
+
+@pytest.fixture
+def app():
+    return build_app()
+
+
+@pytest.fixture
+def client(app):
+    """A client signed in as the seeded admin."""
+    return signed_in(app.test_client())
@@ -0,0 +1,132 @@
+import concurrent.futures
+import contextvars
+import threading
+import time
+
+from flask import request
+from sqlalchemy import func, select
+
+from models import Vehicle, Driver, Trip, MaintenanceRecord, ChargingSession
+from filters import FilterError, check_args, parse_int
+from serializers import format_datetime
+from app_state import app_local
+from replicas import read_engine
+
+
+DASHBOARD_TABLES = frozenset(
+    model.__table__.name for model in (Vehicle, Driver, Trip, MaintenanceRecord, ChargingSession)
+)
+
+DEFAULT_RECENT_TRIPS = 10
+MAX_RECENT_TRIPS = 50
+DEFAULT_WORKERS = 4
+DEFAULT_CACHE_SECONDS = 5
+
+
+def parse_dashboard_args():
+    """The number of recent trips to list, from the `limit` request arg."""
+    check_args({'limit'})
+    limit = parse_int(request.args.get('limit', str(DEFAULT_RECENT_TRIPS)))
+    if not 1 <= limit <= MAX_RECENT_TRIPS:
+        raise FilterError(f'limit must be between 1 and {MAX_RECENT_TRIPS}')
+    return limit
+
+
+# The sections. Each runs on its own connection and returns plain data.
+
+def _vehicle_statuses(connection):
+    counts = dict(connection.execute(select(Vehicle.current_status, func.count()).group_by(Vehicle.current_status)).all())
+    return {status: counts.get(status, 0) for status in Vehicle.STATUS_CHOICES}
+
+
+def _drivers(connection):
+    total, available = connection.execute(
+        select(func.count(), func.count().filter(Driver.is_available.isnot(False)))
+    ).one()
+    return {'total': total, 'available': available}
+
+
+def _open_maintenance(connection):
+    records, vehicles = connection.execute(
+        select(func.count(), func.count(MaintenanceRecord.vehicle_id.distinct()))
+        .where(MaintenanceRecord.resolved.isnot(True))
+    ).one()
+    return {'records': records, 'vehicles': vehicles}
+
+
+def _ongoing_charging(connection):
+    sessions, energy_kwh = connection.execute(
+        select(func.count(), func.coalesce(func.sum(ChargingSession.energy_kwh), 0.0))
+        .where(ChargingSession.end_time.is_(None))
+    ).one()
+    return {'sessions': sessions, 'energy_kwh': round(energy_kwh, 3)}
+
+
+def _recent_trips(connection, limit):
+    rows = connection.execute(
+        select(Trip.id, Trip.start_time, Trip.end_time, Trip.completed, Trip.vehicle_id, Trip.driver_id, Trip.route_id)
+        .order_by(Trip.start_time.desc(), Trip.id.desc())
+        .limit(limit)
+    ).mappings()
+    return [
+        {
+            **row,
+            'start_time': row['start_time'] and format_datetime(row['start_time']),
+            'end_time': row['end_time'] and format_datetime(row['end_time']),
+        }
+        for row in rows
+    ]
+
+
+class Dashboard:
+    """Runs the dashboard sections concurrently, each on its own pooled
+    connection, and keeps each result for a few seconds.
+
+    Unlike the response cache, a kept result is served without reading the
+    version table, so it can lag behind writes by up to DASHBOARD_CACHE_SECONDS.
+    """
+
+    def __init__(self, app):
+        workers = app.config.get('DASHBOARD_WORKERS', DEFAULT_WORKERS)
+        self.ttl = app.config.get('DASHBOARD_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dashboard')
+        self._results = {}
+
+    def cached(self, limit):
+        """The (validators, payload) kept for `limit`, if still fresh."""
+        with self._lock:
+            entry = self._results.get(limit)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1:]
+
+    def build(self, limit, validators):
+        """Run the sections and keep the payload with the `validators` read
+        before them."""
+        engine = read_engine()
+
+        def run(section, *args):
+            with engine.connect() as connection:
+                return section(connection, *args)
+
+        def submit(section, *args):
+            # In a copy of the request's context, so the queries count
+            # towards its metrics.
+            return self._executor.submit(contextvars.copy_context().run, run, section, *args)
+
+        futures = {
+            'vehicles': submit(_vehicle_statuses),
+            'drivers': submit(_drivers),
+            'maintenance': submit(_open_maintenance),
+            'charging': submit(_ongoing_charging),
+            'recent_trips': submit(_recent_trips, limit),
+        }
+        payload = {name: future.result() for name, future in futures.items()}
+
+        with self._lock:
+            self._results[limit] = (time.monotonic() + self.ttl, validators, payload)
+        return payload
+
+
+dashboard = app_local('dashboard', Dashboard)
@@ -0,0 +1,92 @@
+from flask import request
+from sqlalchemy import inspect
+
+
+# The most loader and serialization plans kept per process. Clients choose
+# the (include, fields) keys, so the caches must not grow with them.
+PLAN_CACHE_SIZE = 512
+
+
+class FieldsetError(ValueError):
+    pass
+
+
+def include_tree(include):
+    """Turn relationship paths such as ('trips', 'trips.route') into a nested
+    dict: {'trips': {'route': {}}}."""
+    tree = {}
+    for path in include:
+        node = tree
+        for key in path.split('.'):
+            node = node.setdefault(key, {})
+    return tree
+
+
+def field_map(fields):
+    """Group dotted field names by the relationship path they belong to:
+    ('id', 'trips.start_time') -> {'': {'id'}, 'trips': {'start_time'}}."""
+    only = {}
+    for field in fields:
+        path, _, key = field.rpartition('.')
+        only.setdefault(path, set()).add(key)
+    return only
+
+
+def column_keys(model):
+    """Public column attributes of `model`, in mapper order."""
+    return [attr.key for attr in inspect(model).column_attrs if not attr.key.startswith('_')]
+
+
+def _split_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return tuple(part.strip() for part in value.split(',') if part.strip())
+
+
+def _paths(include):
+    paths = set()
+    for path in include:
+        parts = path.split('.')
+        paths.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return paths
+
+
+def parse_fieldset(model, default_include):
+    """Read the `include` and `fields` request args for a resource.
+
+    `include` selects relationships and must stay within the resource's
+    `default_include` tree; without it the whole default tree is used.
+    `fields` lists the columns to return, dotted for related models
+    (`fields=id,number_plate,trips.start_time`). Models without any listed
+    field return all of their columns.
+
+    Returns normalised (include, fields) tuples, suitable as cache keys for
+    the loader and serialization plans.
+    """
+    allowed = _paths(default_include)
+
+    include = _split_arg('include')
+    if include is None:
+        include = tuple(default_include)
+    else:
+        unknown = sorted(set(include) - allowed)
+        if unknown:
+            raise FieldsetError(f"Cannot include {', '.join(unknown)}")
+        include = tuple(sorted(set(include)))
+
+    fields = _split_arg('fields') or ()
+    included = _paths(include)
+    for path, keys in field_map(fields).items():
+        if path and path not in included:
+            raise FieldsetError(f"Fields requested for '{path}', which is not included")
+
+        target = model
+        for key in path.split('.') if path else ():
+            target = inspect(target).relationships[key].mapper.class_
+
+        unknown = sorted(keys - set(column_keys(target)))
+        if unknown:
+            raise FieldsetError(f"Unknown fields for {target.__name__}: {', '.join(unknown)}")
+
+    return include, tuple(sorted(set(fields)))
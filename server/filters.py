@@ -0,0 +1,132 @@
+import datetime
+import math
+
+from flask import request
+
+from models import LOCAL_TIMEZONE
+
+
+# Query args handled elsewhere (pagination, streaming, fieldsets, change
+# feeds) rather than by a resource's filters.
+RESERVED_ARGS = {'limit', 'cursor', 'stream', 'fields', 'include', 'since', 'ids'}
+
+MAX_IDS = 1000
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise FilterError(f"'{value}' is not an integer")
+
+
+def parse_float(value):
+    try:
+        number = float(value)
+    except ValueError:
+        raise FilterError(f"'{value}' is not a number")
+    if not math.isfinite(number):
+        raise FilterError(f"'{value}' is not a finite number")
+    return number
+
+
+def parse_ids(value):
+    """Distinct ids, in order, from a comma-separated string (the `ids` arg)
+    or a JSON list of integers (a request body)."""
+    if isinstance(value, str):
+        ids = [parse_int(part) for part in value.split(',') if part.strip()]
+    elif isinstance(value, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in value):
+        ids = value
+    else:
+        raise FilterError('ids must be a list of integers')
+
+    if not ids:
+        raise FilterError('ids must not be empty')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_IDS:
+        raise FilterError(f'At most {MAX_IDS} ids can be fetched at once')
+    return ids
+
+
+def parse_bool(value):
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise FilterError(f"'{value}' is not a boolean")
+
+
+def parse_datetime(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise FilterError(f"'{value}' is not an ISO 8601 datetime")
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise FilterError(f"'{value}' is not an ISO 8601 date")
+
+
+def local_time(value):
+    """`value` as the naive wall-clock time in LOCAL_TIMEZONE that naive
+    DateTime columns hold. Naive values are taken to be local already."""
+    if value.tzinfo is not None:
+        value = value.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+    return value
+
+
+def _for_column(column, value):
+    if isinstance(value, datetime.datetime) and not column.type.timezone:
+        return local_time(value)
+    return value
+
+
+def equals(column, parse=parse_int):
+    return lambda value: column == parse(value)
+
+
+def flag(column):
+    return lambda value: column.is_(True) if parse_bool(value) else column.isnot(True)
+
+
+def is_null(column):
+    return lambda value: column.is_(None) if parse_bool(value) else column.isnot(None)
+
+
+def on_or_after(column):
+    return lambda value: column >= _for_column(column, parse_datetime(value))
+
+
+def before(column):
+    return lambda value: column < _for_column(column, parse_datetime(value))
+
+
+def check_args(allowed):
+    """Reject request args not in `allowed`."""
+    unknown = sorted(set(request.args) - set(allowed))
+    if unknown:
+        raise FilterError(f"Unsupported filter: {', '.join(unknown)}")
+
+
+def apply_filters(query, filters):
+    """Apply the filters named in the request args to `query`.
+
+    `filters` maps an arg name to a function building the SQL criterion from
+    the arg's value. Args that are neither filters of this resource nor
+    reserved are rejected.
+    """
+    check_args(RESERVED_ARGS | set(filters))
+
+    for name, build in filters.items():
+        value = request.args.get(name)
+        if value is not None:
+            query = query.filter(build(value))
+    return query
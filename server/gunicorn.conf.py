@@ -0,0 +1,35 @@
+# Read by gunicorn from the directory it is started in:
+#
+#     cd server && gunicorn 'app:create_app()'
+
+import os
+
+
+# Threaded workers: a request waiting on bcrypt (see passwords.py) holds one
+# thread, not its whole process. Keep PASSWORD_HASH_WORKERS +
+# PASSWORD_HASH_QUEUE below `threads` so the rest are left to other requests.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def post_worker_init(worker):
+    # Connect before the worker takes its first request.
+    from pool import warm_up_pools
+    from passwords import DEFAULT_QUEUE, DEFAULT_WORKERS
+
+    app = worker.wsgi
+    warm_up_pools(app)
+
+    hashing = app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS) + app.config.get('PASSWORD_HASH_QUEUE', DEFAULT_QUEUE)
+    if hashing >= worker.cfg.threads:
+        worker.log.warning(
+            'PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE (%d) should be below the %d threads of '
+            'each worker, or logins can occupy all of them', hashing, worker.cfg.threads)
+
+
+def on_starting(server):
+    # Counters of a previous run would otherwise be added to this one's.
+    from metrics import clear_metrics_directory
+
+    if os.environ.get('METRICS_DIR'):
+        clear_metrics_directory(os.environ['METRICS_DIR'])
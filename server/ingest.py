@@ -0,0 +1,291 @@
+import csv
+import datetime
+import io
+import json
+import math
+
+from flask import current_app, request
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+
+from models import db, Trip, ChargingSession, Driver, Vehicle, Route
+from filters import parse_int, local_time
+from rollups import SESSION_ATTRS, add_delta, apply_deltas, new_deltas
+from versions import bump_versions
+
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 10000
+
+# At most this many row errors are listed; all of them are counted.
+MAX_REPORTED_ERRORS = 1000
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class IngestError(ValueError):
+    pass
+
+
+class RowError(ValueError):
+    pass
+
+
+# Field parsers. Each takes the JSON value and returns the column value or
+# raises RowError.
+
+def integer(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RowError('must be an integer')
+    return value
+
+
+def number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise RowError('must be a finite number')
+    return float(value)
+
+
+def boolean(value):
+    if not isinstance(value, bool):
+        raise RowError('must be true or false')
+    return value
+
+
+def timestamp(value):
+    if not isinstance(value, str):
+        raise RowError('must be an ISO 8601 datetime')
+    try:
+        value = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError('must be an ISO 8601 datetime')
+    return local_time(value)
+
+
+class Field:
+    def __init__(self, parse, required=True, default=None, references=None):
+        self.parse = parse
+        self.required = required
+        self.default = default
+        self.references = references
+
+
+class Spec:
+    """How to validate and insert rows of `model`. `check` validates a row
+    across fields once each field is parsed."""
+
+    def __init__(self, model, fields, check=None):
+        self.model = model
+        self.table = model.__table__
+        self.fields = fields
+        self.check = check
+
+    def parse(self, record):
+        if not isinstance(record, dict):
+            raise RowError('must be a JSON object')
+
+        unknown = sorted(set(record) - set(self.fields))
+        if unknown:
+            raise RowError(f"unknown fields: {', '.join(unknown)}")
+
+        row = {}
+        for name, field in self.fields.items():
+            value = record.get(name)
+            if value is None:
+                if field.required:
+                    raise RowError(f'{name} is required')
+                row[name] = field.default
+                continue
+            try:
+                row[name] = field.parse(value)
+            except RowError as e:
+                raise RowError(f'{name} {e}')
+
+        if self.check is not None:
+            self.check(row)
+        return row
+
+
+def _check_times(row):
+    if row['end_time'] is not None and row['end_time'] < row['start_time']:
+        raise RowError('end_time must not be before start_time')
+
+
+def _check_charging_session(row):
+    _check_times(row)
+    if row['energy_kwh'] < 0:
+        raise RowError('energy_kwh must not be negative')
+
+
+TRIP_SPEC = Spec(Trip, {
+    'start_time': Field(timestamp),
+    'end_time': Field(timestamp, required=False),
+    'completed': Field(boolean, required=False, default=False),
+    'driver_id': Field(integer, references=Driver),
+    'vehicle_id': Field(integer, references=Vehicle),
+    'route_id': Field(integer, references=Route),
+}, check=_check_times)
+
+CHARGING_SESSION_SPEC = Spec(ChargingSession, {
+    'start_time': Field(timestamp),
+    'end_time': Field(timestamp, required=False),
+    'energy_kwh': Field(number),
+    'vehicle_id': Field(integer, references=Vehicle),
+}, check=_check_charging_session)
+
+
+def parse_chunk_size():
+    value = request.args.get('chunk_size')
+    if value is None:
+        return current_app.config.get('INGEST_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    size = parse_int(value)
+    if not 1 <= size <= MAX_CHUNK_SIZE:
+        raise IngestError(f'chunk_size must be between 1 and {MAX_CHUNK_SIZE}')
+    return size
+
+
+def read_records():
+    """(row number, decoded record or RowError) for each record of the
+    request body: NDJSON read a line at a time, or a JSON array."""
+    if request.mimetype in NDJSON_TYPES:
+        return _read_ndjson(request.stream)
+    if request.mimetype == 'application/json':
+        try:
+            records = json.load(request.stream)
+        except ValueError:
+            raise IngestError('The body is not valid JSON')
+        if not isinstance(records, list):
+            raise IngestError('The body must be a JSON array')
+        return enumerate(records, 1)
+    raise IngestError(f"Content-Type must be application/json or {NDJSON_TYPES[0]}")
+
+
+def _lines(stream, block_size=64 * 1024):
+    # Iterating the request stream directly reads it a few bytes at a time.
+    pending = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _read_ndjson(stream):
+    number = 0
+    for line in _lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, RowError('is not valid JSON')
+
+
+def _missing_references(spec, rows):
+    """{field: ids referenced by `rows` that do not exist}."""
+    missing = {}
+    for name, field in spec.fields.items():
+        if field.references is None:
+            continue
+        ids = {row[name] for _, row in rows}
+        found = set(db.session.scalars(select(field.references.id).where(field.references.id.in_(ids))))
+        missing[name] = ids - found
+    return missing
+
+
+def _copy(connection, table, columns, rows):
+    # COPY ... FROM STDIN on the connection of the session's transaction.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _insert(spec, rows):
+    """Insert `rows` in the session's transaction and keep the version,
+    change_seq and energy rollups in step, as an ORM flush would."""
+    session = db.session
+    version = bump_versions(session, [spec.table.name])[spec.table.name]
+    for row in rows:
+        row['change_seq'] = version
+
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        _copy(connection, spec.table, list(rows[0]), rows)
+    else:
+        connection.execute(insert(spec.table), rows)
+
+    if spec.model is ChargingSession:
+        deltas = new_deltas()
+        for row in rows:
+            add_delta(deltas, tuple(row[key] for key in SESSION_ATTRS), 1)
+        apply_deltas(session, deltas)
+
+
+def _ingest_chunk(spec, chunk, report):
+    errors = []
+    rows = []
+    for number, record in chunk:
+        try:
+            if isinstance(record, RowError):
+                raise record
+            rows.append((number, spec.parse(record)))
+        except RowError as e:
+            errors.append((number, str(e)))
+
+    if rows:
+        missing = _missing_references(spec, rows)
+        valid = []
+        for number, row in rows:
+            bad = [name for name, ids in missing.items() if row[name] in ids]
+            if bad:
+                errors.append((number, f"{', '.join(bad)} not found"))
+            else:
+                valid.append((number, row))
+
+        if valid:
+            try:
+                _insert(spec, [row for _, row in valid])
+                db.session.commit()
+                report['inserted'] += len(valid)
+            except DBAPIError as e:
+                db.session.rollback()
+                message = str(e.orig).strip().splitlines()[0]
+                errors.extend((number, message) for number, _ in valid)
+
+    report['failed'] += len(errors)
+    for number, message in sorted(errors):
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': number, 'error': message})
+
+
+def ingest(spec, records, chunk_size):
+    """Validate and insert `records` (see read_records) chunk by chunk, each
+    chunk in its own transaction. Invalid rows are skipped and reported by
+    row number; the valid rows of a chunk are inserted together."""
+    report = {'received': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+
+    chunk = []
+    for number, record in records:
+        report['received'] += 1
+        chunk.append((number, record))
+        if len(chunk) == chunk_size:
+            _ingest_chunk(spec, chunk, report)
+            chunk = []
+    if chunk:
+        _ingest_chunk(spec, chunk, report)
+
+    return report
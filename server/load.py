@@ -0,0 +1,166 @@
+import datetime
+
+import numpy as np
+from flask import request
+from sqlalchemy import select, union_all
+
+from models import db, ChargingSession, LOCAL_TIMEZONE
+from filters import FilterError, check_args, parse_int
+from serializers import DATETIME_FORMAT
+from utilization import EPOCH, epoch_seconds, parse_window
+
+
+CHARGING_LOAD_TABLES = frozenset({ChargingSession.__table__.name})
+
+DEFAULT_WINDOW_DAYS = 7
+MAX_WINDOW_DAYS = 92
+DEFAULT_RESOLUTION_MINUTES = 15
+MAX_BUCKETS = 10000
+PEAK_WINDOWS = 5
+
+# Completed sessions starting this long before the window are not read, which
+# keeps the query a range scan on start_time. Ongoing sessions are always read.
+MAX_SESSION_DURATION = datetime.timedelta(days=1)
+
+SECONDS_PER_HOUR = 3600.0
+
+
+def parse_load_args():
+    """(start, end, resolution) from the request args, the resolution in
+    seconds. See parse_window for the window."""
+    check_args({'from', 'to', 'resolution'})
+
+    start, end = parse_window(DEFAULT_WINDOW_DAYS, MAX_WINDOW_DAYS)
+    minutes = parse_int(request.args.get('resolution', str(DEFAULT_RESOLUTION_MINUTES)))
+    if minutes < 1:
+        raise FilterError('resolution must be a positive number of minutes')
+    if (end - start).total_seconds() / (minutes * 60) > MAX_BUCKETS:
+        raise FilterError(f'resolution is too fine: the window would have more than {MAX_BUCKETS} buckets')
+    return start, end, minutes * 60
+
+
+def _fetch(start, end):
+    """(starts, ends, power_kw) of the sessions overlapping [start, end), with
+    times in seconds from `start`, or None. Ongoing sessions run until now."""
+    columns = (epoch_seconds(ChargingSession.start_time), epoch_seconds(ChargingSession.end_time), ChargingSession.energy_kwh)
+    completed = select(*columns).where(
+        ChargingSession.start_time >= start - MAX_SESSION_DURATION,
+        ChargingSession.start_time < end,
+        ChargingSession.end_time > start,
+    )
+    ongoing = select(*columns).where(ChargingSession.end_time.is_(None), ChargingSession.start_time < end)
+    rows = db.session.connection().execute(union_all(completed, ongoing)).fetchall()
+    if not rows:
+        return None
+
+    columns = [np.array(column, dtype=np.float64) for column in zip(*rows)]
+    origin = (start - EPOCH).total_seconds()
+    now = datetime.datetime.now(LOCAL_TIMEZONE).replace(tzinfo=None, second=0, microsecond=0)
+    now = (now - EPOCH).total_seconds()
+
+    starts = columns[0] - origin
+    ends = np.where(np.isnan(columns[1]), max(now - origin, 0.0), columns[1] - origin)
+    ends = np.maximum(ends, starts)
+
+    # Each session draws its energy evenly over its whole duration.
+    hours = (ends - starts) / SECONDS_PER_HOUR
+    power = np.divide(columns[2], hours, out=np.zeros_like(hours), where=hours > 0)
+    return starts, ends, power
+
+
+def _sweep(starts, ends, power, window):
+    """The step functions of charging vehicles and kW over [0, window] as
+    (event times, vehicles after each event, kW after each event)."""
+    times = np.clip(np.concatenate([starts, ends]), 0, window)
+    steps = np.repeat([1, -1], len(starts))
+
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    vehicles = np.cumsum(steps[order])
+    kw = np.cumsum(steps[order] * np.concatenate([power, power])[order])
+
+    # Only the level after the last of several events at the same time is
+    # ever in effect.
+    last = np.r_[times[1:] != times[:-1], True]
+    return times[last], vehicles[last], np.maximum(kw[last], 0.0)
+
+
+def _integral(times, levels, points):
+    """Integral from 0 to each of `points` of the step function that is
+    `levels[i]` from `times[i]` on (and 0 before times[0])."""
+    area = np.concatenate([[0.0], np.cumsum(levels[:-1] * np.diff(times))])
+    i = np.searchsorted(times, points, side='right') - 1
+    inside = i >= 0
+    i = np.maximum(i, 0)
+    return np.where(inside, area[i] + levels[i] * (points - times[i]), 0.0)
+
+
+def _buckets(times, vehicles, kw, window, resolution):
+    """Peak and average vehicles charging and average kW per bucket."""
+    bounds = np.r_[np.arange(0, window, resolution), window].astype(np.float64)
+    m = len(bounds) - 1
+    lengths = np.diff(bounds)
+
+    avg_vehicles = np.diff(_integral(times, vehicles.astype(np.float64), bounds)) / lengths
+    avg_kw = np.diff(_integral(times, kw, bounds)) / lengths
+
+    # The peak of a bucket is its level on entry or right after any event in
+    # it; events arrive in time order, so those of a bucket are contiguous.
+    entry = np.searchsorted(times, bounds[:-1], side='right') - 1
+    peak = np.where(entry >= 0, vehicles[np.maximum(entry, 0)], 0)
+    inner = np.minimum((times // resolution).astype(np.int64), m - 1)
+    keep = times < window
+    if keep.any():
+        inner, levels = inner[keep], vehicles[keep]
+        first = np.flatnonzero(np.r_[True, inner[1:] != inner[:-1]])
+        np.maximum.at(peak, inner[first], np.maximum.reduceat(levels, first))
+    return bounds[:-1], peak, avg_vehicles, avg_kw
+
+
+def load_report(start, end, resolution):
+    """Vehicles charging and estimated kW draw over [start, end) in buckets
+    of `resolution` seconds, the peak and the busiest buckets. A session
+    draws energy_kwh spread evenly from its start to its end (or to now for
+    ongoing sessions)."""
+    window = int((end - start).total_seconds())
+    report = {
+        'from': start.strftime(DATETIME_FORMAT),
+        'to': end.strftime(DATETIME_FORMAT),
+        'resolution_minutes': resolution // 60,
+        'peak': None,
+        'peak_windows': [],
+        'series': [],
+    }
+
+    sessions = _fetch(start, end)
+    if sessions is None:
+        times, vehicles, kw = np.zeros(1), np.zeros(1, dtype=np.int64), np.zeros(1)
+    else:
+        times, vehicles, kw = _sweep(*sessions, window)
+
+    offsets, peak, avg_vehicles, avg_kw = _buckets(times, vehicles, kw, window, resolution)
+
+    def at(offset):
+        return (start + datetime.timedelta(seconds=float(offset))).strftime(DATETIME_FORMAT)
+
+    report['series'] = [
+        {'from': at(offset), 'peak_vehicles': p, 'avg_vehicles': round(v, 3), 'avg_kw': round(k, 3)}
+        for offset, p, v, k in zip(offsets.tolist(), peak.tolist(), avg_vehicles.tolist(), avg_kw.tolist())
+    ]
+
+    if sessions is not None:
+        in_window = times < window
+        if in_window.any():
+            i = int(np.argmax(np.where(in_window, vehicles, -1)))
+            j = int(np.argmax(np.where(in_window, kw, -1.0)))
+            report['peak'] = {
+                'vehicles': int(vehicles[i]), 'vehicles_at': at(times[i]),
+                'kw': round(float(kw[j]), 3), 'kw_at': at(times[j]),
+            }
+
+    busiest = np.argsort(-avg_kw, kind='stable')[:PEAK_WINDOWS]
+    report['peak_windows'] = [
+        {**report['series'][b], 'to': at(min(offsets[b] + resolution, window))}
+        for b in busiest.tolist() if avg_kw[b] > 0
+    ]
+    return report
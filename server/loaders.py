@@ -0,0 +1,110 @@
+import functools
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import configure_mappers, joinedload, load_only, selectinload
+
+from fieldsets import PLAN_CACHE_SIZE, include_tree, field_map
+
+# The backref attributes (Vehicle.admin, Trip.driver, ...) only exist once the
+# mappers are configured.
+configure_mappers()
+
+
+# The relationship tree each resource serializes by default (and the widest one
+# a client may ask for with `?include=`). Loader plans are derived from the same
+# tree, so a page or a single record is fetched with a fixed number of SELECTs
+# instead of one lazy load per related row.
+
+VEHICLE_INCLUDE = (
+    'admin',
+    'driver',
+    'trips',
+    'trips.driver',
+    'trips.route',
+    'maintenance_records',
+    'charging_sessions',
+)
+
+DRIVER_INCLUDE = (
+    'vehicle',
+    'trips',
+    'trips.vehicle',
+    'trips.route',
+)
+
+TRIP_INCLUDE = (
+    'vehicle',
+    'vehicle.admin',
+    'vehicle.driver',
+    'vehicle.maintenance_records',
+    'vehicle.charging_sessions',
+    'driver',
+    'driver.vehicle',
+    'route',
+)
+
+ROUTE_INCLUDE = ()
+
+ROUTE_DETAIL_INCLUDE = (
+    'trips',
+    'trips.vehicle',
+    'trips.driver',
+)
+
+MAINTENANCE_RECORD_INCLUDE = (
+    'vehicle',
+    'vehicle.admin',
+    'vehicle.driver',
+    'vehicle.trips',
+    'vehicle.charging_sessions',
+)
+
+CHARGING_SESSION_INCLUDE = (
+    'vehicle',
+    'vehicle.admin',
+    'vehicle.driver',
+    'vehicle.trips',
+    'vehicle.maintenance_records',
+)
+
+
+def _load_only(model, keys):
+    return load_only(*[getattr(model, key) for key in keys])
+
+
+def _relationship_loaders(model, tree, only, path):
+    mapper = inspect(model)
+    loaders = []
+    for key, subtree in tree.items():
+        relationship = mapper.relationships[key]
+        target = relationship.mapper.class_
+        child = f'{path}.{key}' if path else key
+
+        # Many-to-one relationships are joined into the parent query;
+        # collections use selectin loading, which stays correct when the
+        # parent query is LIMITed or streamed with yield_per.
+        if relationship.uselist:
+            loader = selectinload(getattr(model, key))
+        else:
+            loader = joinedload(getattr(model, key))
+
+        nested = _relationship_loaders(target, subtree, only, child)
+        if child in only:
+            nested.insert(0, _load_only(target, only[child]))
+        if nested:
+            loader = loader.options(*nested)
+
+        loaders.append(loader)
+    return loaders
+
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def loader_plan(model, include=(), fields=()):
+    """Loader options for `model` that eagerly load the relationships in
+    `include` and, when `fields` are given, restrict each SELECT to the
+    requested columns (primary keys are always loaded)."""
+    only = field_map(fields)
+    options = _relationship_loaders(model, include_tree(include), only, '')
+    if '' in only:
+        options.insert(0, _load_only(model, only['']))
+    return tuple(options)
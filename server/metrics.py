@@ -0,0 +1,324 @@
+import collections
+import contextvars
+import functools
+import glob
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app_state import app_local
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# (name, type, help) of each metric, in the order they are exposed.
+METRICS = (
+    ('fleet_http_requests_total', 'counter', 'Requests handled, by resource, method and status.'),
+    ('fleet_http_request_duration_seconds', 'histogram', 'Time to handle a request.'),
+    ('fleet_http_request_sql_queries', 'histogram', 'SQL statements executed per request.'),
+    ('fleet_http_request_sql_seconds_total', 'counter', 'Time spent executing SQL statements.'),
+    ('fleet_http_request_serialization_seconds_total', 'counter', 'Time spent serializing rows and encoding JSON.'),
+    ('fleet_http_response_bytes_total', 'counter', 'Bytes of response bodies, streamed responses excepted.'),
+    ('fleet_serialization_errors_total', 'counter', 'Rows that could not be serialized, by model.'),
+)
+
+
+class RequestMetrics:
+    """What one request spent on SQL and serialization. Shared with the
+    threads a request hands work to, hence the lock."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+
+    def add_serialization(self, seconds):
+        with self._lock:
+            self.serialization_seconds += seconds
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class serialization_timer:
+    """Adds the time spent in the `with` block to the request's
+    serialization time."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_serialization(time.perf_counter() - self.start)
+
+
+def timed_representation(output):
+    """A Flask-RESTful representation that counts as serialization time."""
+    @functools.wraps(output)
+    def wrapper(data, code, headers=None):
+        with serialization_timer():
+            return output(data, code, headers)
+    return wrapper
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['metrics_query_start'].pop()
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_query(time.perf_counter() - start)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('metrics_query_start'):
+        connection.info['metrics_query_start'].pop()
+
+
+class MemoryValues:
+    """Values by sample key for a single process."""
+
+    def __init__(self):
+        self._values = collections.defaultdict(float)
+
+    def add(self, key, amount):
+        self._values[key] += amount
+
+    def items(self):
+        return list(self._values.items())
+
+
+class MmapValues:
+    """Values by sample key, written by one process to a memory-mapped file
+    that any process can read (see read_values).
+
+    The file is an 8-byte count of the bytes in use followed by entries of a
+    4-byte key length, the key, padding to 8 bytes and an 8-byte float. An
+    entry is written before the count that covers it, so readers never see
+    a partial entry.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self._file = open(path, 'w+b')
+        self._size = self.INITIAL_SIZE
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._used = 8
+        struct.pack_into('Q', self._map, 0, self._used)
+        self._positions = {}
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        length = 4 + len(encoded)
+        length += -length % 8
+        if self._used + length + 8 > self._size:
+            while self._used + length + 8 > self._size:
+                self._size *= 2
+            self._file.truncate(self._size)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._size)
+
+        struct.pack_into(f'I{len(encoded)}s', self._map, self._used, len(encoded), encoded)
+        position = self._used + length
+        struct.pack_into('d', self._map, position, 0.0)
+        self._used = position + 8
+        struct.pack_into('Q', self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        value, = struct.unpack_from('d', self._map, position)
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def items(self):
+        return [(key, struct.unpack_from('d', self._map, position)[0]) for key, position in self._positions.items()]
+
+
+def read_values(path):
+    """The (key, value) entries of a file written by MmapValues."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return
+    used, = struct.unpack_from('Q', data, 0)
+    position = 8
+    while position < used:
+        length, = struct.unpack_from('I', data, position)
+        key = data[position + 4:position + 4 + length].decode('utf-8')
+        position += 4 + length
+        position += -position % 8
+        value, = struct.unpack_from('d', data, position)
+        position += 8
+        yield key, value
+
+
+def _histogram(name, labels, buckets):
+    keys = [f'{name}_bucket{{{labels},le="{le}"}}' for le in buckets]
+    return keys, f'{name}_bucket{{{labels},le="+Inf"}}', f'{name}_sum{{{labels}}}', f'{name}_count{{{labels}}}'
+
+
+def _observe(updates, histogram, buckets, value):
+    keys, infinity, total, count = histogram
+    for key, le in zip(keys, buckets):
+        updates.append((key, 1 if value <= le else 0))
+    updates += [(infinity, 1), (total, value), (count, 1)]
+
+
+def _format(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """Request metrics in the Prometheus text format.
+
+    Each process adds to its own values; with METRICS_DIR set, they live in
+    a file of that directory and /metrics sums the files of every process,
+    including those of workers that have since exited. Without it, each
+    process only reports its own requests.
+    """
+
+    _files = itertools.count()
+
+    def __init__(self, app):
+        self.directory = app.config.get('METRICS_DIR')
+        self._lock = threading.Lock()
+        self._pid = None
+        self._values = None
+        self._keys = {}
+
+    def _store(self):
+        # Called with the lock held. A forked worker must not write to the
+        # file of its parent.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            if self.directory:
+                path = os.path.join(self.directory, f'metrics_{self._pid}_{next(self._files)}.db')
+                self._values = MmapValues(path)
+            else:
+                self._values = MemoryValues()
+        return self._values
+
+    def _request_keys(self, resource, method):
+        keys = self._keys.get((resource, method))
+        if keys is None:
+            labels = f'resource="{resource}",method="{method}"'
+            keys = self._keys[(resource, method)] = {
+                'labels': labels,
+                'duration': _histogram('fleet_http_request_duration_seconds', labels, DURATION_BUCKETS),
+                'queries': _histogram('fleet_http_request_sql_queries', labels, QUERY_BUCKETS),
+                'sql_seconds': f'fleet_http_request_sql_seconds_total{{{labels}}}',
+                'serialization_seconds': f'fleet_http_request_serialization_seconds_total{{{labels}}}',
+                'bytes': f'fleet_http_response_bytes_total{{{labels}}}',
+            }
+        return keys
+
+    def observe_request(self, resource, method, status, metrics, response_bytes):
+        keys = self._request_keys(resource, method)
+        updates = [
+            (f'fleet_http_requests_total{{{keys["labels"]},status="{status}"}}', 1),
+            (keys['sql_seconds'], metrics.sql_seconds),
+            (keys['serialization_seconds'], metrics.serialization_seconds),
+            (keys['bytes'], response_bytes),
+        ]
+        _observe(updates, keys['duration'], DURATION_BUCKETS, time.perf_counter() - metrics.start)
+        _observe(updates, keys['queries'], QUERY_BUCKETS, metrics.queries)
+
+        with self._lock:
+            store = self._store()
+            for key, amount in updates:
+                store.add(key, amount)
+
+    def count_serialization_error(self, model_name):
+        with self._lock:
+            self._store().add(f'fleet_serialization_errors_total{{model="{model_name}"}}', 1)
+
+    def _all_values(self):
+        if not self.directory:
+            with self._lock:
+                return self._store().items()
+        values = []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'metrics_*.db'))):
+            values.extend(read_values(path))
+        return values
+
+    def render(self):
+        totals = {}
+        for key, value in self._all_values():
+            totals[key] = totals.get(key, 0.0) + value
+
+        families = collections.defaultdict(list)
+        for key, value in totals.items():
+            name = key.split('{', 1)[0]
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in HISTOGRAMS:
+                    name = name[:-len(suffix)]
+            families[name].append(f'{key} {_format(value)}')
+
+        lines = []
+        for name, kind, description in METRICS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            lines += families.get(name, [])
+        return '\n'.join(lines) + '\n'
+
+
+HISTOGRAMS = {name for name, kind, _ in METRICS if kind == 'histogram'}
+
+metrics_registry = app_local('metrics', MetricsRegistry)
+
+
+def _start_request():
+    _current.set(RequestMetrics())
+
+
+def _finish_request(response):
+    metrics = _current.get()
+    if metrics is None:
+        return response
+    _current.set(None)
+
+    view = current_app.view_functions.get(request.endpoint)
+    resource = getattr(view, 'view_class', None)
+    resource = resource.__name__ if resource is not None else (request.endpoint or 'none')
+    # Streamed bodies are not measured.
+    response_bytes = 0 if response.is_streamed else response.content_length or 0
+    metrics_registry.observe_request(resource, request.method, response.status_code, metrics, response_bytes)
+    return response
+
+
+def init_metrics(app):
+    """Record the metrics of each request handled by `app`."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def clear_metrics_directory(directory):
+    """Remove the files of a previous run; call before workers start."""
+    for path in glob.glob(os.path.join(directory, 'metrics_*.db')):
+        os.remove(path)
@@ -0,0 +1,51 @@
+"""Added change sequences and tombstones
+
+Revision ID: 5b8d2e7c1a43
+Revises: a41f6c2e8d97
+Create Date: 2026-10-17 13:26:08.391457
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8d2e7c1a43'
+down_revision = 'a41f6c2e8d97'
+branch_labels = None
+depends_on = None
+
+
+TRACKED_TABLES = ('admins', 'vehicles', 'drivers', 'trips', 'routes', 'maintenance_records', 'charging_sessions')
+
+
+def upgrade():
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_table_name_version', 'tombstones', ['table_name', 'version'])
+
+    for table in TRACKED_TABLES:
+        op.add_column(table, sa.Column('change_seq', sa.Integer(), server_default='0', nullable=False))
+        # Existing rows count as changed at the table's current version, so a
+        # full sync (`since=0`) returns them.
+        op.execute(sa.text(
+            f"UPDATE {table} SET change_seq = "
+            f"COALESCE((SELECT version FROM table_versions WHERE table_name = '{table}'), 0)"
+        ))
+        op.create_index(f'ix_{table}_change_seq_id', table, ['change_seq', 'id'])
+
+
+def downgrade():
+    for table in reversed(TRACKED_TABLES):
+        op.drop_index(f'ix_{table}_change_seq_id', table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('change_seq')
+
+    op.drop_index('ix_tombstones_table_name_version', table_name='tombstones')
+    op.drop_table('tombstones')
@@ -0,0 +1,70 @@
+"""Added indexes for foreign keys and time columns
+
+Revision ID: 7c3e5a1f9b2d
+Revises: d16b694b4fec
+Create Date: 2026-10-17 09:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e5a1f9b2d'
+down_revision = 'd16b694b4fec'
+branch_labels = None
+depends_on = None
+
+
+# Trips are listed by (start_time DESC NULLS LAST, id DESC). Postgres needs the
+# order in the index; SQLite scans ascending indexes backwards instead.
+TRIP_ORDER = {'start_time': 'DESC NULLS LAST', 'id': 'DESC'}
+
+# Partial indexes are only created on dialects that support them.
+PARTIAL_INDEX_DIALECTS = ('postgresql', 'sqlite')
+
+
+def upgrade():
+    dialect = op.get_context().dialect.name
+
+    op.create_index('ix_trips_start_time_id', 'trips', ['start_time', 'id'], postgresql_ops=TRIP_ORDER)
+    op.create_index('ix_trips_vehicle_id_start_time_id', 'trips', ['vehicle_id', 'start_time', 'id'], postgresql_ops=TRIP_ORDER)
+    op.create_index('ix_trips_driver_id_start_time_id', 'trips', ['driver_id', 'start_time', 'id'], postgresql_ops=TRIP_ORDER)
+    op.create_index('ix_trips_route_id_start_time_id', 'trips', ['route_id', 'start_time', 'id'], postgresql_ops=TRIP_ORDER)
+
+    op.create_index('ix_charging_sessions_vehicle_id_start_time', 'charging_sessions', ['vehicle_id', 'start_time'])
+    op.create_index('ix_charging_sessions_start_time', 'charging_sessions', ['start_time'])
+
+    op.create_index('ix_maintenance_records_vehicle_id_record_date', 'maintenance_records', ['vehicle_id', 'record_date'])
+    op.create_index('ix_maintenance_records_record_date', 'maintenance_records', ['record_date'])
+
+    if dialect in PARTIAL_INDEX_DIALECTS:
+        op.create_index(
+            'ix_charging_sessions_ongoing_vehicle_id_id', 'charging_sessions', ['vehicle_id', 'id'],
+            postgresql_where=sa.text('end_time IS NULL'),
+            sqlite_where=sa.text('end_time IS NULL'),
+        )
+        op.create_index(
+            'ix_maintenance_records_open_vehicle_id_id', 'maintenance_records', ['vehicle_id', 'id'],
+            postgresql_where=sa.text('resolved IS NOT true'),
+            sqlite_where=sa.text('resolved IS NOT 1'),
+        )
+
+
+def downgrade():
+    dialect = op.get_context().dialect.name
+
+    if dialect in PARTIAL_INDEX_DIALECTS:
+        op.drop_index('ix_maintenance_records_open_vehicle_id_id', table_name='maintenance_records')
+        op.drop_index('ix_charging_sessions_ongoing_vehicle_id_id', table_name='charging_sessions')
+
+    op.drop_index('ix_maintenance_records_record_date', table_name='maintenance_records')
+    op.drop_index('ix_maintenance_records_vehicle_id_record_date', table_name='maintenance_records')
+
+    op.drop_index('ix_charging_sessions_start_time', table_name='charging_sessions')
+    op.drop_index('ix_charging_sessions_vehicle_id_start_time', table_name='charging_sessions')
+
+    op.drop_index('ix_trips_route_id_start_time_id', table_name='trips')
+    op.drop_index('ix_trips_driver_id_start_time_id', table_name='trips')
+    op.drop_index('ix_trips_vehicle_id_start_time_id', table_name='trips')
+    op.drop_index('ix_trips_start_time_id', table_name='trips')
@@ -0,0 +1,39 @@
+"""Added table_versions
+
+Revision ID: a41f6c2e8d97
+Revises: 7c3e5a1f9b2d
+Create Date: 2026-10-17 11:02:17.845120
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f6c2e8d97'
+down_revision = '7c3e5a1f9b2d'
+branch_labels = None
+depends_on = None
+
+
+VERSIONED_TABLES = ('admins', 'vehicles', 'drivers', 'trips', 'routes', 'maintenance_records', 'charging_sessions')
+
+
+def upgrade():
+    table_versions = op.create_table('table_versions',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    op.bulk_insert(table_versions, [
+        {'table_name': name, 'version': 1, 'updated_at': now} for name in VERSIONED_TABLES
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
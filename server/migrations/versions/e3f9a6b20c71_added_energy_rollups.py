@@ -0,0 +1,43 @@
+"""Added energy rollups
+
+Revision ID: e3f9a6b20c71
+Revises: 5b8d2e7c1a43
+Create Date: 2026-10-17 15:04:52.118734
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3f9a6b20c71'
+down_revision = '5b8d2e7c1a43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('energy_rollups',
+    sa.Column('vehicle_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('week_start', sa.Date(), nullable=False),
+    sa.Column('energy_kwh', sa.Float(), nullable=False),
+    sa.Column('session_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['vehicle_id'], ['vehicles.id'], name=op.f('fk_energy_rollups_vehicle_id_vehicles'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('vehicle_id', 'day')
+    )
+    op.create_index('ix_energy_rollups_day', 'energy_rollups', ['day'])
+
+    # Filled by `flask backfill-energy-rollups`.
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    op.bulk_insert(sa.table('table_versions', sa.column('table_name'), sa.column('version'), sa.column('updated_at')), [
+        {'table_name': 'energy_rollups', 'version': 1, 'updated_at': now},
+    ])
+
+
+def downgrade():
+    op.execute("DELETE FROM table_versions WHERE table_name = 'energy_rollups'")
+    op.drop_index('ix_energy_rollups_day', table_name='energy_rollups')
+    op.drop_table('energy_rollups')
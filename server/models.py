@@ -1,36 +1,69 @@
+from flask import current_app, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData, Enum
+from flask_sqlalchemy.session import Session
+from sqlalchemy import MetaData, Enum, event
 from sqlalchemy.orm import validates
 from sqlalchemy.ext.hybrid import hybrid_property
 from flask_bcrypt import Bcrypt
-from sqlalchemy_serializer import SerializerMixin
+
+from serializers import SerializerMixin
 
 import datetime
 import pytz
 
 
+# Naive DateTime columns hold wall-clock times in the fleet's timezone.
+LOCAL_TIMEZONE = pytz.timezone('Africa/Nairobi')
+
 metadata = MetaData(naming_convention={
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
 })
 
-db = SQLAlchemy(metadata=metadata)
+
+class RoutingSession(Session):
+    """Sends the reads of a GET request to the read replica chosen for it,
+    when the app has replicas (see replicas.py). Once the session writes it
+    stays on the primary, so it reads its own writes."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get('primary'):
+            if getattr(clause, 'is_dml', False):
+                self.info['primary'] = True
+            elif has_request_context():
+                router = current_app.extensions.get('replica_router')
+                key = router.for_request() if router is not None else None
+                if key is not None:
+                    return db.engines[key]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _pin_to_primary(session, flush_context, instances):
+    session.info['primary'] = True
+
+
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 
 class Admin(db.Model, SerializerMixin):
     __tablename__ = 'admins'
 
-    serialize_rules = ('-vehicles.admin',)
-
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True)
     _password_hash = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
+    # Version of the table at which the row last changed (see versions.py).
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
     # Relationships
     vehicles = db.relationship('Vehicle', backref='admin', cascade='all, delete-orphan')
 
 
+    __table_args__ = (
+        db.Index('ix_admins_change_seq_id', 'change_seq', 'id'),
+    )
+
     @hybrid_property
     def password_hash(self):
         raise AttributeError('Password hash cannot be viewed!')
@@ -49,14 +82,6 @@ class Admin(db.Model, SerializerMixin):
 class Vehicle(db.Model, SerializerMixin):
     __tablename__ = 'vehicles'
 
-    serialize_rules = (
-        '-admin.vehicles', 
-        '-driver.vehicle', 
-        '-trips.vehicle', 
-        '-maintenance_records.vehicle', 
-        '-charging_sessions.vehicle',
-        )
-
     STATUS_CHOICES = ('idle', 'active', 'maintenance', 'charging')
 
     id = db.Column(db.Integer, primary_key=True)
@@ -66,6 +91,7 @@ class Vehicle(db.Model, SerializerMixin):
     current_status = db.Column(Enum(*STATUS_CHOICES, name='vehicle_status'), nullable=False, default='idle')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
     # Relationships
     admin_id = db.Column(db.Integer, db.ForeignKey('admins.id'))
@@ -77,6 +103,10 @@ class Vehicle(db.Model, SerializerMixin):
     charging_sessions = db.relationship('ChargingSession', backref='vehicle', cascade='all, delete-orphan', lazy=True)
 
 
+    __table_args__ = (
+        db.Index('ix_vehicles_change_seq_id', 'change_seq', 'id'),
+    )
+
     @validates('current_status')
     def validate_status(self, key, value):
         if value not in self.STATUS_CHOICES:
@@ -89,11 +119,6 @@ class Vehicle(db.Model, SerializerMixin):
 class Driver(db.Model, SerializerMixin):
     __tablename__ = 'drivers'
 
-    serialize_rules = (
-        '-vehicle.driver', 
-        '-trips.driver',
-        )
-    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     driving_license_number = db.Column(db.Integer, unique=True, nullable=False)
@@ -103,6 +128,7 @@ class Driver(db.Model, SerializerMixin):
     is_available = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
 
     # Relationships
@@ -111,22 +137,21 @@ class Driver(db.Model, SerializerMixin):
 
     trips = db.relationship('Trip', backref='driver', cascade='all, delete-orphan', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_drivers_change_seq_id', 'change_seq', 'id'),
+    )
+
     def __repr__(self):
         return f'<Driver {self.name}>'
 
 class Trip(db.Model, SerializerMixin):
     __tablename__ = 'trips'
 
-    serialize_rules = (
-        '-vehicle.trips', 
-        '-driver.trips', 
-        '-route.trips',
-        )
-
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime)
     end_time = db.Column(db.DateTime)
     completed = db.Column(db.Boolean, default=False)
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
     # Relationships
     driver_id = db.Column(db.Integer, db.ForeignKey('drivers.id'), nullable=False)
@@ -138,58 +163,140 @@ class Trip(db.Model, SerializerMixin):
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
     # route = db.relationship('Route', back_populates='trips', lazy=True)
 
+    # Trips are listed newest first: (start_time DESC NULLS LAST, id DESC).
+    # SQLite reads ascending indexes backwards for that order; Postgres needs
+    # the order spelled out.
+    __table_args__ = (
+        db.Index('ix_trips_change_seq_id', 'change_seq', 'id'),
+        db.Index('ix_trips_start_time_id', 'start_time', 'id',
+                 postgresql_ops={'start_time': 'DESC NULLS LAST', 'id': 'DESC'}),
+        db.Index('ix_trips_vehicle_id_start_time_id', 'vehicle_id', 'start_time', 'id',
+                 postgresql_ops={'start_time': 'DESC NULLS LAST', 'id': 'DESC'}),
+        db.Index('ix_trips_driver_id_start_time_id', 'driver_id', 'start_time', 'id',
+                 postgresql_ops={'start_time': 'DESC NULLS LAST', 'id': 'DESC'}),
+        db.Index('ix_trips_route_id_start_time_id', 'route_id', 'start_time', 'id',
+                 postgresql_ops={'start_time': 'DESC NULLS LAST', 'id': 'DESC'}),
+    )
+
     def __repr__(self):
         return f"<Trip ID: {self.id} (Driver: {self.driver_id}, Vehicle: {self.vehicle_id})>"
 
 class Route(db.Model, SerializerMixin):
     __tablename__ = 'routes'
 
-    serialize_rules = ('-trips.route',)
-
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     start_latitude = db.Column(db.Float, nullable=False)
     start_longitude = db.Column(db.Float, nullable=False)
     end_latitude = db.Column(db.Float, nullable=False)
     end_longitude = db.Column(db.Float, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
     # Relationships
     trips = db.relationship('Trip', backref='route', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_routes_change_seq_id', 'change_seq', 'id'),
+    )
+
     def __repr__(self):
         return f"<Route {self.name} (ID: {self.id})>"
     
 class MaintenanceRecord(db.Model, SerializerMixin):
     __tablename__ = 'maintenance_records'
 
-    serialize_rules = ('-vehicle.maintenance_records',)
-
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String, nullable=False)
-    record_date = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.datetime.now(pytz.timezone('Africa/Nairobi')))
+    record_date = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.datetime.now(LOCAL_TIMEZONE))
     resolved_date = db.Column(db.DateTime, nullable=True)
     resolved = db.Column(db.Boolean, default=False)
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
     # Relationships
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
     # vehicle = db.relationship('Vehicle', back_populates='maintenance_records', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_maintenance_records_change_seq_id', 'change_seq', 'id'),
+        db.Index('ix_maintenance_records_vehicle_id_record_date', 'vehicle_id', 'record_date'),
+        db.Index('ix_maintenance_records_record_date', 'record_date'),
+        # Open records are a small, hot subset.
+        db.Index('ix_maintenance_records_open_vehicle_id_id', 'vehicle_id', 'id',
+                 postgresql_where=db.text('resolved IS NOT true'),
+                 sqlite_where=db.text('resolved IS NOT 1')),
+    )
+
     def __repr__(self):
         return f"<MaintenanceRecord {self.id} (Vehicle: {self.vehicle_id} (Description: {self.description}))>"
     
 class ChargingSession(db.Model, SerializerMixin):
     __tablename__ = 'charging_sessions'
 
-    serialize_rules = ('-vehicle.charging_sessions',)
-
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=True)
     energy_kwh = db.Column(db.Float, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False, server_default='0')
 
     # Relationships
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
     # vehicle = db.relationship('Vehicle', back_populates='charging_sessions', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_charging_sessions_change_seq_id', 'change_seq', 'id'),
+        db.Index('ix_charging_sessions_vehicle_id_start_time', 'vehicle_id', 'start_time'),
+        db.Index('ix_charging_sessions_start_time', 'start_time'),
+        # Ongoing sessions are a small, hot subset.
+        db.Index('ix_charging_sessions_ongoing_vehicle_id_id', 'vehicle_id', 'id',
+                 postgresql_where=db.text('end_time IS NULL'),
+                 sqlite_where=db.text('end_time IS NULL')),
+    )
+
+    def __repr__(self):
+        return f"<ChargingSession {self.id} (Vehicle: {self.vehicle_id})>"
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    # One row per table, bumped in the same transaction as any write to it.
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<TableVersion {self.table_name} v{self.version}>"
+
+class Tombstone(db.Model):
+    __tablename__ = 'tombstones'
+
+    # One row per deleted row, so that change feeds can report deletions.
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_tombstones_table_name_version', 'table_name', 'version'),
+    )
+
+    def __repr__(self):
+        return f"<Tombstone {self.table_name} {self.row_id} v{self.version}>"
+
+class EnergyRollup(db.Model):
+    __tablename__ = 'energy_rollups'
+
+    # Energy of the completed charging sessions of one vehicle, by the day the
+    # sessions started. Maintained by rollups.py as sessions change.
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    week_start = db.Column(db.Date, nullable=False)
+    energy_kwh = db.Column(db.Float, nullable=False, default=0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_energy_rollups_day', 'day'),
+    )
+
     def __repr__(self):
-        return f"<ChargingSession {self.id} (Vehicle: {self.vehicle_id})>"
\ No newline at end of file
+        return f"<EnergyRollup Vehicle: {self.vehicle_id} {self.day} ({self.energy_kwh} kWh)>"
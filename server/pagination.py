@@ -0,0 +1,158 @@
+import base64
+import datetime
+import json
+
+from flask import request
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import operators
+
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value, column):
+    # Cursors come back from clients, so each value must fit its column.
+    if value is None:
+        if not column.nullable:
+            raise ValueError(value)
+        return None
+
+    expected = column.type.python_type
+    if expected is datetime.datetime:
+        if not isinstance(value, dict) or list(value) != ['dt'] or not isinstance(value['dt'], str):
+            raise ValueError(value)
+        value = datetime.datetime.fromisoformat(value['dt'])
+        if value.tzinfo is not None:
+            raise ValueError(value)
+        return value
+    if isinstance(value, bool) or not isinstance(value, expected):
+        raise ValueError(value)
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """The values of `cursor` for the keyset `columns`."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [_decode_value(value, column) for value, column in zip(values, columns)]
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def _split_key(key):
+    # Accepts `Model.column`, `Model.column.asc()` or `Model.column.desc()`.
+    modifier = getattr(key, 'modifier', None)
+    if modifier in (operators.asc_op, operators.desc_op):
+        return key.element, modifier is operators.desc_op
+    return key, False
+
+
+def pagination_key(key):
+    """The column behind a keyset entry such as `Trip.start_time.desc()`."""
+    return _split_key(key)[0]
+
+
+def _after(keys, values):
+    """Rows strictly after `values` in keyset order, written as
+    `k0 <= v0 AND (k0 < v0 OR (k1 <= v1 AND ...))` (for descending keys) so
+    that the leading column bounds an index range scan."""
+    (column, descending), value = keys[0], values[0]
+    strictly_after = column < value if descending else column > value
+    if len(keys) == 1:
+        return strictly_after
+    not_before = column <= value if descending else column >= value
+    return and_(not_before, or_(strictly_after, _after(keys[1:], values[1:])))
+
+
+def parse_limit():
+    limit = request.args.get('limit', DEFAULT_PAGE_LIMIT)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_LIMIT)
+
+
+def keyset_segments(query, *keys):
+    """Order `query` by `keys` and, when a `cursor` request arg is given,
+    restrict it to the rows after that cursor.
+
+    Only the leading key may be nullable; its NULLs sort last. To keep every
+    query an index range scan, the rows after a cursor are returned as
+    consecutive segments (the remaining non-NULL rows, then the NULL rows)
+    which are read in order. Returns the segment queries and the parsed keys
+    as (column, descending) pairs.
+    """
+    keys = [_split_key(key) for key in keys]
+    if any(column.nullable for column, _ in keys[1:]):
+        raise ValueError('Only the leading keyset column may be nullable')
+
+    order_by = []
+    for column, descending in keys:
+        clause = column.desc() if descending else column.asc()
+        if column.nullable:
+            clause = clause.nulls_last()
+        order_by.append(clause)
+    query = query.order_by(*order_by)
+
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return [query], keys
+
+    values = decode_cursor(cursor, [column for column, _ in keys])
+    lead, _ = keys[0]
+
+    if values[0] is None:
+        # Already inside the trailing NULLs of the leading key.
+        return [query.filter(lead.is_(None), _after(keys[1:], values[1:]))], keys
+
+    segments = [query.filter(_after(keys, values))]
+    if lead.nullable:
+        segments.append(query.filter(lead.is_(None)))
+    return segments, keys
+
+
+def paginate(query, *keys):
+    """Apply keyset pagination to `query` using the `limit` and `cursor`
+    request args.
+
+    `keys` give the sort order; the last key must be unique (normally the
+    primary key). Returns the rows of the requested page and the cursor for
+    the next page, or None when there are no further rows.
+    """
+    limit = parse_limit()
+    segments, keys = keyset_segments(query, *keys)
+
+    rows = []
+    for segment in segments:
+        rows.extend(segment.limit(limit + 1 - len(rows)).all())
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column, _ in keys])
+
+    return rows, next_cursor
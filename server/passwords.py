@@ -0,0 +1,87 @@
+import concurrent.futures
+import threading
+
+from models import bcrypt
+from app_state import app_local
+
+
+DEFAULT_ROUNDS = 12
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE = 2
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool, so a burst of sign-ins
+    uses at most PASSWORD_HASH_WORKERS cores instead of every request worker.
+
+    At most PASSWORD_HASH_QUEUE hashes wait for a free thread; beyond that
+    PasswordHasherBusy is raised at once rather than queueing the request.
+    The limits are per process: the requests waiting on a hash hold their
+    threads, so under gunicorn they must leave some of the worker's threads
+    free (see gunicorn.conf.py).
+    """
+
+    def __init__(self, app=None):
+        self.rounds = DEFAULT_ROUNDS
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS)
+        workers = app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+        queue = app.config.get('PASSWORD_HASH_QUEUE', DEFAULT_QUEUE)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def _hash(self, password):
+        return bcrypt.generate_password_hash(password, self.rounds).decode('utf-8')
+
+    @staticmethod
+    def _verify(password_hash, password):
+        try:
+            return bcrypt.check_password_hash(password_hash, password)
+        except ValueError:
+            # Not a bcrypt hash.
+            return False
+
+    def needs_rehash(self, password_hash):
+        # $2b$<rounds>$<salt and hash>
+        parts = password_hash.split('$')
+        return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) != self.rounds
+
+    def set_password(self, admin, password):
+        admin._password_hash = self._run(self._hash, password)
+
+    def check_password(self, admin, password):
+        """Whether `password` is the admin's. A hash made with another work
+        factor is replaced (left to the caller to commit) when the pool has
+        room to spare."""
+        if not admin._password_hash or not self._run(self._verify, admin._password_hash, password):
+            return False
+
+        if self.needs_rehash(admin._password_hash):
+            try:
+                self.set_password(admin, password)
+            except PasswordHasherBusy:
+                pass
+        return True
+
+
+password_hasher = app_local('password_hasher', PasswordHasher)
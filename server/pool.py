@@ -0,0 +1,170 @@
+import collections
+import functools
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+
+# Settings that map directly onto create_engine() pool arguments.
+POOL_SETTINGS = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+    'DB_POOL_PRE_PING': 'pool_pre_ping',
+}
+
+POOL_EVENTS = {
+    'connect': 'connects',
+    'checkout': 'checkouts',
+    'checkin': 'checkins',
+    'invalidate': 'invalidations',
+    'close': 'closes',
+}
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings. Options given in
+    SQLALCHEMY_ENGINE_OPTIONS itself take precedence."""
+    options = {'poolclass': TimedQueuePool}
+    for setting, option in POOL_SETTINGS.items():
+        if config.get(setting) is not None:
+            options[option] = config[setting]
+
+    # Milliseconds. Only PostgreSQL has a per-statement timeout.
+    timeout = config.get('DB_STATEMENT_TIMEOUT')
+    if timeout is not None and make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    return options
+
+
+class Waits:
+    """How long checkouts took to get a connection: waiting for one to be
+    checked in, or opening a new one while the pool has room."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.timeouts += timed_out
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'total_seconds': round(self.total, 6),
+                'max_seconds': round(self.max, 6),
+                'timeouts': self.timeouts,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records in `waits` how long each checkout took. The
+    record survives engine.dispose(), which replaces the pool."""
+
+    def __init__(self, *args, waits=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = waits or Waits()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.waits.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.waits.record(time.perf_counter() - start)
+        return record
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.waits = self.waits
+        return pool
+
+
+class PoolStats:
+    """Counts of the pool events of `engine`, with the live state of its
+    pool."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+        # Listening on the engine follows the pool across dispose().
+        for name, counter in POOL_EVENTS.items():
+            event.listen(engine, name, functools.partial(self._count, counter))
+
+    def _count(self, counter, *args):
+        with self._lock:
+            self.counts[counter] += 1
+
+    def to_dict(self):
+        pool = self.engine.pool
+        with self._lock:
+            stats = {counter: self.counts[counter] for counter in POOL_EVENTS.values()}
+        stats['pool'] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                # Negative while the pool is still below its size.
+                overflow=max(pool.overflow(), 0),
+            )
+        waits = getattr(pool, 'waits', None)
+        stats['waits'] = waits.to_dict() if waits is not None else None
+        return stats
+
+
+def init_pool_stats(app):
+    """Start counting the pool events of each engine of `app`."""
+    with app.app_context():
+        app.extensions['pool_stats'] = {key: PoolStats(engine) for key, engine in db.engines.items()}
+
+
+def pool_stats():
+    """PoolStats.to_dict() of each engine of the current app, by bind."""
+    return {key or 'default': stats.to_dict() for key, stats in current_app.extensions['pool_stats'].items()}
+
+
+def warm_up(engine, count=None):
+    """Open `count` connections (by default, the pool size) and return them
+    to the pool, so the first requests do not wait for them."""
+    pool = engine.pool
+    if count is None:
+        count = pool.size() if isinstance(pool, QueuePool) else 0
+
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def warm_up_pools(app):
+    """Prepare the pools of a newly started worker process (see
+    gunicorn.conf.py)."""
+    with app.app_context():
+        for engine in db.engines.values():
+            # Connections made before a fork (gunicorn --preload) belong to
+            # the parent; leave them to it.
+            engine.dispose(close=False)
+            warm_up(engine, app.config.get('DB_POOL_WARMUP'))
@@ -0,0 +1,208 @@
+import datetime
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from sqlalchemy import exc, select
+
+from models import db, TableVersion
+from versions import commit_listeners
+
+
+VERSION_TABLE = TableVersion.__table__
+
+REPLICA_BIND_PREFIX = 'replica_'
+READ_METHODS = ('GET', 'HEAD')
+
+# Session key of the {table_name: version} the client has written and not
+# yet seen on every replica.
+WRITTEN_VERSIONS_KEY = 'written_versions'
+
+DEFAULT_MAX_LAG = 5
+DEFAULT_LAG_CHECK_INTERVAL = 1
+
+
+def replica_binds(config):
+    """SQLALCHEMY_BINDS entries (replica_1, replica_2, ...) for the URIs in
+    REPLICA_DATABASE_URIS, with the same engine options as the primary."""
+    options = config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    return {
+        f'{REPLICA_BIND_PREFIX}{n}': {**options, 'url': uri}
+        for n, uri in enumerate(config.get('REPLICA_DATABASE_URIS') or (), 1)
+    }
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class ReplicaRouter:
+    """Chooses, round-robin, the replica that serves the reads of each GET
+    request (see models.RoutingSession).
+
+    Replicas that cannot be reached, or that lag the primary by more than
+    REPLICA_MAX_LAG seconds, are passed over; if none is left the primary
+    serves the request. Lag is measured from the version table at most once
+    every REPLICA_LAG_CHECK_INTERVAL seconds: a replica is behind while it
+    lacks a version the primary has, and its lag is the age of the oldest
+    such change seen.
+
+    A client that has written only reads from replicas that have its writes
+    (see _remember_writes), so it always sees them, even on the next
+    request.
+    """
+
+    def __init__(self, app, keys):
+        self.keys = keys
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', DEFAULT_LAG_CHECK_INTERVAL)
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._checking = False
+        self._behind_since = {}
+        self._lags = {}
+        self._replica_versions = {}
+        self._usable = []
+        self._turn = itertools.count()
+
+    @staticmethod
+    def _versions(engine):
+        with engine.connect() as connection:
+            rows = connection.execute(select(VERSION_TABLE.c.table_name, VERSION_TABLE.c.version, VERSION_TABLE.c.updated_at))
+            return {name: (version, updated_at) for name, version, updated_at in rows}
+
+    def _measure(self, behind_since):
+        """Read the version tables of the primary and of each replica, without
+        the lock held. Returns (lags, behind_since, replica_versions) for
+        _publish, or None when the primary cannot be read."""
+        try:
+            primary = self._versions(db.engines[None])
+        except exc.DBAPIError:
+            return None
+
+        now = _utcnow()
+        behind_since = dict(behind_since)
+        lags = {}
+        replica_versions = {}
+        for key in self.keys:
+            try:
+                replica = self._versions(db.engines[key])
+            except exc.DBAPIError:
+                lags[key] = None
+                continue
+
+            behind = [
+                updated_at for name, (version, updated_at) in primary.items()
+                if replica.get(name, (0, None))[0] < version
+            ]
+            if behind:
+                since = behind_since.setdefault(key, min(behind))
+                lags[key] = max((now - since).total_seconds(), 0.0)
+            else:
+                behind_since.pop(key, None)
+                lags[key] = 0.0
+            replica_versions[key] = {name: version for name, (version, _) in replica.items()}
+        return lags, behind_since, replica_versions
+
+    def _publish(self, lags, behind_since, replica_versions):
+        # Called with the lock held.
+        self._lags = lags
+        self._behind_since = behind_since
+        self._replica_versions.update(replica_versions)
+        self._usable = [key for key in self.keys if lags[key] is not None and lags[key] <= self.max_lag]
+
+    def _check(self):
+        """Measure the replicas if a check is due and no other thread is
+        already measuring them. The measuring reads run outside the lock,
+        so a slow replica holds up one request rather than every read."""
+        with self._lock:
+            now = time.monotonic()
+            if self._checking or (self._checked_at is not None and now - self._checked_at < self.check_interval):
+                return
+            self._checking = True
+            behind_since = self._behind_since
+
+        measured = None
+        try:
+            measured = self._measure(behind_since)
+        finally:
+            with self._lock:
+                # When the primary cannot be read, lag cannot be measured;
+                # keep reading from the replicas that were in step.
+                if measured is not None:
+                    self._publish(*measured)
+                self._checked_at = now
+                self._checking = False
+
+    def _reached(self, key, written):
+        versions = self._replica_versions.get(key, {})
+        return all(versions.get(name, 0) >= version for name, version in written.items())
+
+    def choose(self, written=None):
+        """The bind key of a replica in step with the primary and holding
+        the `written` {table_name: version}, or None."""
+        self._check()
+        with self._lock:
+            usable = [key for key in self._usable if not written or self._reached(key, written)]
+        if not usable:
+            return None
+        return usable[next(self._turn) % len(usable)]
+
+    def caught_up(self, written):
+        """Whether every replica in use holds the `written` versions."""
+        with self._lock:
+            return bool(self._usable) and all(self._reached(key, written) for key in self._usable)
+
+    def for_request(self):
+        """The replica serving the current request, chosen once so that all
+        of its reads see the same snapshot, or None for the primary."""
+        if 'replica' not in g:
+            g.replica = None
+            if request.method in READ_METHODS:
+                written = session.get(WRITTEN_VERSIONS_KEY)
+                g.replica = self.choose(written)
+                if written and self.caught_up(written):
+                    session.pop(WRITTEN_VERSIONS_KEY)
+        return g.replica
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                key: {'lag_seconds': self._lags.get(key), 'in_use': key in self._usable}
+                for key in self.keys
+            }
+
+
+def init_replicas(app):
+    """Route the reads of GET requests to the replica binds of `app`, if
+    it has any."""
+    keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key and key.startswith(REPLICA_BIND_PREFIX))
+    if keys:
+        app.extensions['replica_router'] = ReplicaRouter(app, keys)
+
+
+def read_engine():
+    """The engine for reads made outside db.session in the current request."""
+    router = current_app.extensions.get('replica_router')
+    key = router.for_request() if router is not None else None
+    return db.engines[key] if key is not None else db.engine
+
+
+def _remember_writes(versions):
+    """Keep the versions committed by a request in its client's session,
+    so that its later reads wait for a replica that has them."""
+    if not has_request_context() or current_app.extensions.get('replica_router') is None:
+        return
+    written = dict(session.get(WRITTEN_VERSIONS_KEY, {}))
+    for name, version in versions.items():
+        written[name] = max(version, written.get(name, 0))
+    session[WRITTEN_VERSIONS_KEY] = written
+
+
+commit_listeners.append(_remember_writes)
+
+
+def replica_stats():
+    router = current_app.extensions.get('replica_router')
+    return router.to_dict() if router is not None else {}
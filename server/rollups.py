@@ -0,0 +1,260 @@
+import collections
+import datetime
+
+import click
+from flask import request
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from models import db, ChargingSession, EnergyRollup, LOCAL_TIMEZONE
+from filters import FilterError, check_args, parse_int, parse_date
+from versions import bump_versions
+
+
+ROLLUP_TABLE = EnergyRollup.__table__
+ENERGY_TABLES = frozenset({ROLLUP_TABLE.name})
+
+GRANULARITIES = ('day', 'week')
+DEFAULT_RANGE_DAYS = 30
+
+# The session attributes a rollup row depends on.
+SESSION_ATTRS = ('vehicle_id', 'start_time', 'end_time', 'energy_kwh')
+
+
+def week_start(day):
+    """The Monday of `day`'s week."""
+    return day - datetime.timedelta(days=day.weekday())
+
+
+# Maintenance. Each flush collects the change in (energy, session count) per
+# (vehicle_id, day) from the sessions it writes, and applies them in one
+# statement per key once the sessions themselves are written. Only completed
+# sessions (with an end_time) count.
+
+def new_deltas():
+    return collections.defaultdict(lambda: [0.0, 0])
+
+
+def add_delta(deltas, values, sign):
+    """Count the session with `values` (see SESSION_ATTRS) in `deltas` once,
+    positively or negatively."""
+    vehicle_id, start_time, end_time, energy_kwh = values
+    if end_time is None:
+        return
+    delta = deltas[(vehicle_id, start_time.date())]
+    delta[0] += sign * energy_kwh
+    delta[1] += sign
+
+
+def _collect(session, values, sign):
+    add_delta(session.info.setdefault('energy_deltas', new_deltas()), values, sign)
+
+
+def _current_values(target):
+    return tuple(getattr(target, key) for key in SESSION_ATTRS)
+
+
+def _committed_values(connection, target):
+    histories = [get_history(target, key) for key in SESSION_ATTRS]
+    if any(history.added and not history.deleted for history in histories):
+        # Set while expired, so the old value was never loaded; the row has
+        # not been written yet.
+        columns = [getattr(ChargingSession, key) for key in SESSION_ATTRS]
+        return tuple(connection.execute(select(*columns).where(ChargingSession.id == target.id)).one())
+    return tuple(
+        history.deleted[0] if history.deleted else getattr(target, key)
+        for key, history in zip(SESSION_ATTRS, histories)
+    )
+
+
+@event.listens_for(ChargingSession, 'after_insert')
+def _session_inserted(mapper, connection, target):
+    _collect(object_session(target), _current_values(target), 1)
+
+
+@event.listens_for(ChargingSession, 'before_update')
+def _session_updated(mapper, connection, target):
+    old, new = _committed_values(connection, target), _current_values(target)
+    if old != new:
+        session = object_session(target)
+        _collect(session, old, -1)
+        _collect(session, new, 1)
+
+
+@event.listens_for(ChargingSession, 'before_delete')
+def _session_deleted(mapper, connection, target):
+    _collect(object_session(target), _committed_values(connection, target), -1)
+
+
+def _upsert(dialect):
+    """INSERT ... ON CONFLICT for the dialects that have it, else None."""
+    if dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return None
+
+    table = ROLLUP_TABLE
+    statement = upsert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.vehicle_id, table.c.day],
+        set_={
+            'energy_kwh': table.c.energy_kwh + statement.excluded.energy_kwh,
+            'session_count': table.c.session_count + statement.excluded.session_count,
+        },
+    )
+
+
+def _params(row):
+    return {'v': row['vehicle_id'], 'd': row['day'], 'e': row['energy_kwh'], 'c': row['session_count']}
+
+
+def apply_deltas(session, deltas):
+    """Add {(vehicle_id, day): (energy_kwh, session_count)} to the rollups,
+    dropping rows left without sessions."""
+    connection = session.connection()
+    table = ROLLUP_TABLE
+
+    rows = [
+        {'vehicle_id': vehicle_id, 'day': day, 'week_start': week_start(day), 'energy_kwh': energy_kwh, 'session_count': count}
+        for (vehicle_id, day), (energy_kwh, count) in sorted(deltas.items())
+        if count or energy_kwh
+    ]
+    if not rows:
+        return
+
+    # Only keys that gain sessions may need a new row. The others already
+    # have one, unless it went with its vehicle (ON DELETE CASCADE), and
+    # must not bring it back.
+    added = [row for row in rows if row['session_count'] > 0]
+    changed = [row for row in rows if row['session_count'] <= 0]
+
+    key = (table.c.vehicle_id == bindparam('v')) & (table.c.day == bindparam('d'))
+    add = update(table).where(key).values(
+        energy_kwh=table.c.energy_kwh + bindparam('e'),
+        session_count=table.c.session_count + bindparam('c'),
+    )
+
+    upsert = _upsert(connection.dialect)
+    if upsert is not None:
+        if added:
+            # One executemany for any number of keys.
+            connection.execute(upsert, added)
+    else:
+        for row in added:
+            result = connection.execute(add, _params(row))
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(**row))
+
+    if changed:
+        # Keys whose row is gone match nothing.
+        connection.execute(add, [_params(row) for row in changed])
+        removed = [_params(row) for row in changed if row['session_count'] < 0]
+        if removed:
+            connection.execute(delete(table).where(key, table.c.session_count <= 0), removed)
+
+    bump_versions(session, [table.name])
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_after_flush(session, flush_context):
+    deltas = session.info.pop('energy_deltas', None)
+    if deltas:
+        apply_deltas(session, deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('energy_deltas', None)
+
+
+def backfill(session):
+    """Rebuild every rollup row from the charging sessions. Returns the
+    number of rows written."""
+    day = func.date(ChargingSession.start_time, type_=db.Date)
+    totals = session.execute(
+        select(ChargingSession.vehicle_id, day, func.sum(ChargingSession.energy_kwh), func.count())
+        .where(ChargingSession.end_time.isnot(None))
+        .group_by(ChargingSession.vehicle_id, day)
+    ).all()
+
+    session.execute(delete(ROLLUP_TABLE))
+    rows = [
+        {'vehicle_id': vehicle_id, 'day': day, 'week_start': week_start(day), 'energy_kwh': energy_kwh, 'session_count': count}
+        for vehicle_id, day, energy_kwh, count in totals
+    ]
+    if rows:
+        session.execute(insert(ROLLUP_TABLE), rows)
+
+    bump_versions(session, [ROLLUP_TABLE.name])
+    return len(rows)
+
+
+@click.command('backfill-energy-rollups')
+@with_appcontext
+def backfill_energy_rollups_command():
+    """Rebuild the energy rollups from the charging sessions."""
+    count = backfill(db.session)
+    db.session.commit()
+    click.echo(f'Wrote {count} energy rollup rows.')
+
+
+# Reporting.
+
+def parse_energy_args():
+    """(granularity, start, end, vehicle_id) from the request args. The range
+    is inclusive and defaults to the last DEFAULT_RANGE_DAYS days."""
+    check_args({'granularity', 'from', 'to', 'vehicle_id'})
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise FilterError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    end = request.args.get('to')
+    end = parse_date(end) if end else datetime.datetime.now(LOCAL_TIMEZONE).date()
+    start = request.args.get('from')
+    start = parse_date(start) if start else end - datetime.timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end:
+        raise FilterError('from must not be after to')
+
+    vehicle_id = request.args.get('vehicle_id')
+    vehicle_id = parse_int(vehicle_id) if vehicle_id is not None else None
+
+    return granularity, start, end, vehicle_id
+
+
+def _totals(energy_kwh, count):
+    return {'energy_kwh': round(energy_kwh, 3), 'sessions': count}
+
+
+def energy_report(granularity, start, end, vehicle_id=None):
+    """Energy per vehicle and for the whole fleet per day or week (weeks
+    start on Monday and are clipped to the range), read from the rollups."""
+    period = EnergyRollup.day if granularity == 'day' else EnergyRollup.week_start
+    query = (
+        select(EnergyRollup.vehicle_id, period, func.sum(EnergyRollup.energy_kwh), func.sum(EnergyRollup.session_count))
+        .where(EnergyRollup.day >= start, EnergyRollup.day <= end)
+        .group_by(EnergyRollup.vehicle_id, period)
+        .order_by(EnergyRollup.vehicle_id, period)
+    )
+    if vehicle_id is not None:
+        query = query.where(EnergyRollup.vehicle_id == vehicle_id)
+
+    vehicles = []
+    fleet = collections.defaultdict(lambda: [0.0, 0])
+    for vid, day, energy_kwh, count in db.session.execute(query):
+        vehicles.append({'vehicle_id': vid, 'period': day.isoformat(), **_totals(energy_kwh, count)})
+        fleet[day][0] += energy_kwh
+        fleet[day][1] += count
+
+    return {
+        'granularity': granularity,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'vehicles': vehicles,
+        'fleet': [{'period': day.isoformat(), **_totals(*fleet[day])} for day in sorted(fleet)],
+        'total': _totals(sum(e for e, _ in fleet.values()), sum(c for _, c in fleet.values())),
+    }
@@ -1,7 +1,7 @@
 import random
 from faker import Faker
-from app import app
-from models import db, Admin, Vehicle, Driver, Trip, Route, MaintenanceRecord, ChargingSession
+from app import create_app
+from models import db, Admin, Vehicle, Driver, Trip, Route, MaintenanceRecord, ChargingSession, EnergyRollup
 import datetime
 import pytz
 
@@ -49,8 +49,9 @@ def generate_kenyan_phone(used_phones):
              return full_number
         
 if __name__ == '__main__':
-    with app.app_context():
+    with create_app().app_context():
         print("Clearing existing data...")
+        EnergyRollup.query.delete()
         ChargingSession.query.delete()
         MaintenanceRecord.query.delete()
         Trip.query.delete()
@@ -0,0 +1,117 @@
+import enum
+import functools
+import operator
+
+from sqlalchemy import Date, DateTime, Enum, inspect
+
+from fieldsets import PLAN_CACHE_SIZE, include_tree, field_map
+
+
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def format_datetime(value):
+    return value.strftime(DATETIME_FORMAT)
+
+
+def format_date(value):
+    return value.strftime(DATE_FORMAT)
+
+
+def format_enum(value):
+    return value.value if isinstance(value, enum.Enum) else value
+
+
+def _formatter(column_type):
+    if isinstance(column_type, DateTime):
+        return format_datetime
+    if isinstance(column_type, Date):
+        return format_date
+    if isinstance(column_type, Enum) and column_type.enum_class is not None:
+        return format_enum
+    return None
+
+
+class SerializationPlan:
+    """A flat extraction plan for one model and one include tree.
+
+    Columns are read with a single attrgetter, temporal and enum columns are
+    formatted, and included relationships are serialized with their own
+    plans. Nothing is parsed or inspected per row.
+    """
+
+    __slots__ = ('keys', 'getter', 'formatted', 'relations')
+
+    def __init__(self, keys, formatted, relations):
+        self.keys = keys
+        self.formatted = formatted
+        self.relations = relations
+        if len(keys) == 1:
+            getter = operator.attrgetter(keys[0])
+            self.getter = lambda obj: (getter(obj),)
+        else:
+            self.getter = operator.attrgetter(*keys)
+
+    def __call__(self, obj):
+        data = dict(zip(self.keys, self.getter(obj)))
+
+        for key, fmt in self.formatted:
+            value = data[key]
+            if value is not None:
+                data[key] = fmt(value)
+
+        for key, many, plan in self.relations:
+            value = getattr(obj, key)
+            if many:
+                data[key] = [plan(item) for item in value]
+            else:
+                data[key] = None if value is None else plan(value)
+
+        return data
+
+
+def _compile(model, tree, only, path=''):
+    mapper = inspect(model)
+    wanted = only.get(path)
+
+    keys = []
+    formatted = []
+    for attr in mapper.column_attrs:
+        if attr.key.startswith('_'):
+            continue
+        if wanted is not None and attr.key not in wanted:
+            continue
+        keys.append(attr.key)
+        fmt = _formatter(attr.columns[0].type)
+        if fmt is not None:
+            formatted.append((attr.key, fmt))
+
+    relations = []
+    for key, subtree in tree.items():
+        relationship = mapper.relationships.get(key)
+        if relationship is None:
+            raise ValueError(f"'{key}' is not a relationship of {model.__name__}")
+        child = f'{path}.{key}' if path else key
+        plan = _compile(relationship.mapper.class_, subtree, only, child)
+        relations.append((key, relationship.uselist, plan))
+
+    return SerializationPlan(tuple(keys), tuple(formatted), tuple(relations))
+
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_plan(model, include=(), fields=()):
+    """Compile (and cache) the plan for `model` with the relationship paths
+    in `include`, e.g. ('trips', 'trips.route'), limited to the dotted column
+    names in `fields` when given."""
+    return _compile(model, include_tree(include), field_map(fields))
+
+
+class SerializerMixin:
+    # Relationship paths serialized by default, e.g. ('trips', 'trips.route').
+    serialize_include = ()
+
+    def to_dict(self, include=None, fields=()):
+        if include is None:
+            include = self.serialize_include
+        return compile_plan(type(self), tuple(include), tuple(fields))(self)
@@ -0,0 +1,275 @@
+import math
+import threading
+
+import numpy as np
+from flask import request
+
+from models import Route
+from filters import FilterError, check_args, parse_float, parse_int
+from app_state import app_local
+
+
+ROUTE_TABLES = frozenset({Route.__table__.name})
+
+EARTH_RADIUS_KM = 6371.0088
+
+DEFAULT_K = 5
+MAX_K = 100
+DEFAULT_WITHIN_LIMIT = 100
+MAX_WITHIN_LIMIT = 1000
+
+# The grid is sized for about this many endpoints per cell.
+POINTS_PER_CELL = 4
+MIN_CELL_DEGREES = 1e-4
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between points given in radians; any argument
+    may be an array."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _lon_gap(lon, lon_lo, lon_hi):
+    """Degrees of longitude from `lon` to the nearer edge of [lon_lo,
+    lon_hi], going either way round, so across the antimeridian too."""
+    if (lon - lon_lo) % 360.0 <= lon_hi - lon_lo:
+        return 0.0
+    east, west = (lon_lo - lon) % 360.0, (lon - lon_hi) % 360.0
+    return min(east, west)
+
+
+class RouteGrid:
+    """Start and end points of all routes bucketed into a uniform lat/lon
+    grid. Points are stored sorted by cell, so every cell is a slice of the
+    point arrays. Immutable once built."""
+
+    def __init__(self, routes):
+        self.routes = [route.to_dict() for route in routes]
+        n = len(routes)
+
+        lat = np.array([r.start_latitude for r in routes] + [r.end_latitude for r in routes], dtype=np.float64)
+        lon = np.array([r.start_longitude for r in routes] + [r.end_longitude for r in routes], dtype=np.float64)
+        owner = np.concatenate([np.arange(n), np.arange(n)])
+        is_end = np.repeat([False, True], n)
+
+        if n:
+            extent = max(np.ptp(lat), np.ptp(lon))
+            self.cell = max(extent / math.sqrt(max(2 * n / POINTS_PER_CELL, 1)), MIN_CELL_DEGREES)
+        else:
+            self.cell = 1.0
+
+        rows = np.floor(lat / self.cell).astype(np.int64)
+        cols = np.floor(lon / self.cell).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+
+        self.lat, self.lon = lat[order], lon[order]
+        self.lat_rad, self.lon_rad = np.radians(self.lat), np.radians(self.lon)
+        self.owner, self.is_end = owner[order], is_end[order]
+
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]) if n else np.array([], dtype=np.int64)
+        stops = np.r_[starts[1:], len(rows)]
+        self.cells = {(int(rows[a]), int(cols[a])): (int(a), int(b)) for a, b in zip(starts, stops)}
+
+        if n:
+            self.row_range = (int(rows.min()), int(rows.max()))
+            self.col_range = (int(cols.min()), int(cols.max()))
+
+    def _cell_of(self, lat, lon):
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def _ring(self, row, col, r):
+        """Point indexes in the cells exactly `r` cells (Chebyshev) from
+        (row, col), skipping cells outside the occupied range."""
+        (row_min, row_max), (col_min, col_max) = self.row_range, self.col_range
+        cells = []
+        if r == 0:
+            cells.append((row, col))
+        else:
+            for i in (row - r, row + r):
+                if row_min <= i <= row_max:
+                    cells.extend((i, j) for j in range(max(col - r, col_min), min(col + r, col_max) + 1))
+            for j in (col - r, col + r):
+                if col_min <= j <= col_max:
+                    cells.extend((i, j) for i in range(max(row - r + 1, row_min), min(row + r - 1, row_max) + 1))
+
+        slices = [self.cells[cell] for cell in cells if cell in self.cells]
+        if not slices:
+            return None
+        return np.concatenate([np.arange(a, b) for a, b in slices])
+
+    def _lower_bound_km(self, lat, lon, row, col, r):
+        """No unvisited point is closer than this once rings 0..r around
+        (row, col) are visited. The unvisited occupied cells form up to four
+        rectangles; for each, hav(d) >= hav(lat gap) + cos(lat) *
+        cos(max |lat| in it) * hav(lon gap)."""
+        (row_min, row_max), (col_min, col_max) = self.row_range, self.col_range
+        side_rows = (max(row - r, row_min), min(row + r, row_max))
+        rectangles = [
+            ((row_min, row - r - 1), (col_min, col_max)),
+            ((row + r + 1, row_max), (col_min, col_max)),
+            (side_rows, (col_min, col - r - 1)),
+            (side_rows, (col + r + 1, col_max)),
+        ]
+
+        bound = math.inf
+        for (i0, i1), (j0, j1) in rectangles:
+            if i0 > i1 or j0 > j1:
+                continue
+            lat_lo, lat_hi = i0 * self.cell, (i1 + 1) * self.cell
+            lon_lo, lon_hi = j0 * self.cell, (j1 + 1) * self.cell
+            lat_gap = math.radians(max(lat_lo - lat, lat - lat_hi, 0.0))
+            lon_gap = math.radians(_lon_gap(lon, lon_lo, lon_hi))
+            cos_lat = math.cos(math.radians(lat)) * math.cos(math.radians(min(max(abs(lat_lo), abs(lat_hi)), 90.0)))
+            hav = math.sin(lat_gap / 2) ** 2 + cos_lat * math.sin(lon_gap / 2) ** 2
+            bound = min(bound, 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(hav), 1.0)))
+        return bound
+
+    def _result(self, position, distance=None, is_end=None):
+        route = dict(self.routes[position])
+        if distance is not None:
+            route['distance_km'] = round(float(distance), 3)
+            route['nearest_point'] = 'end' if is_end else 'start'
+        return route
+
+    def nearest(self, lat, lon, k):
+        """The `k` routes with a start or end point closest to (lat, lon).
+
+        Rings of cells are searched outwards, keeping the k best routes so
+        far, until no unvisited cell can hold a closer point. Outside the
+        area covered by routes every point is about equally far, so all of
+        them are compared at once instead.
+        """
+        if not self.routes:
+            return []
+
+        row, col = self._cell_of(lat, lon)
+        (row_min, row_max), (col_min, col_max) = self.row_range, self.col_range
+        lat_rad, lon_rad = math.radians(lat), math.radians(lon)
+
+        if not (row_min <= row <= row_max and col_min <= col <= col_max):
+            distances = haversine_km(lat_rad, lon_rad, self.lat_rad, self.lon_rad)
+            # Each route has two points, so its k closest are among the 2k
+            # closest points.
+            points = np.argpartition(distances, min(2 * k, len(distances)) - 1)[:2 * k]
+            points, distances = self._closest_routes(points, distances[points], k)
+        else:
+            points, distances = np.empty(0, dtype=np.int64), np.empty(0)
+            last = max(row - row_min, row_max - row, col - col_min, col_max - col)
+            for r in range(last + 1):
+                ring = self._ring(row, col, r)
+                if ring is not None:
+                    ring_distances = haversine_km(lat_rad, lon_rad, self.lat_rad[ring], self.lon_rad[ring])
+                    points, distances = self._closest_routes(
+                        np.concatenate([points, ring]), np.concatenate([distances, ring_distances]), k
+                    )
+                if len(points) == k and distances[-1] <= self._lower_bound_km(lat, lon, row, col, r):
+                    break
+
+        return [self._result(self.owner[p], d, self.is_end[p]) for p, d in zip(points, distances)]
+
+    def _closest_routes(self, points, distances, k):
+        # Closest point of each route, then the k closest routes in order.
+        order = np.argsort(distances, kind='stable')
+        _, first = np.unique(self.owner[points[order]], return_index=True)
+        chosen = order[np.sort(first)][:k]
+        return points[chosen], distances[chosen]
+
+    def within(self, min_lon, min_lat, max_lon, max_lat, limit):
+        """Routes with a start or end point inside the box, by id, and the
+        total number of matches."""
+        if not self.routes:
+            return [], 0
+
+        row_lo, col_lo = self._cell_of(min_lat, min_lon)
+        row_hi, col_hi = self._cell_of(max_lat, max_lon)
+        row_lo, row_hi = max(row_lo, self.row_range[0]), min(row_hi, self.row_range[1])
+        col_lo, col_hi = max(col_lo, self.col_range[0]), min(col_hi, self.col_range[1])
+        if row_lo > row_hi or col_lo > col_hi:
+            return [], 0
+
+        # Walk whichever is smaller: the cells in the box or the occupied cells.
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) <= len(self.cells):
+            cells = (
+                self.cells.get((i, j)) for i in range(row_lo, row_hi + 1) for j in range(col_lo, col_hi + 1)
+            )
+        else:
+            cells = (
+                span for (i, j), span in self.cells.items() if row_lo <= i <= row_hi and col_lo <= j <= col_hi
+            )
+        slices = [span for span in cells if span is not None]
+        if not slices:
+            return [], 0
+
+        points = np.concatenate([np.arange(a, b) for a, b in slices])
+        inside = (
+            (self.lat[points] >= min_lat) & (self.lat[points] <= max_lat)
+            & (self.lon[points] >= min_lon) & (self.lon[points] <= max_lon)
+        )
+        positions = np.unique(self.owner[points[inside]])
+        return [self._result(p) for p in positions[:limit]], len(positions)
+
+
+class RouteIndex:
+    """The RouteGrid for the current version of the routes table, rebuilt
+    on first use after any route changes (in this or another worker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._grid = None
+
+    def grid(self, versions):
+        """The grid for `versions`, as read by Validators for ROUTE_TABLES."""
+        version, _ = versions.get(Route.__table__.name, (0, None))
+        if self._version != version or self._grid is None:
+            with self._lock:
+                if self._version != version or self._grid is None:
+                    self._grid = RouteGrid(Route.query.order_by(Route.id).all())
+                    self._version = version
+        return self._grid
+
+
+route_index = app_local('route_index', lambda app: RouteIndex())
+
+
+def _coordinate(name, low, high):
+    value = request.args.get(name)
+    if value is None:
+        raise FilterError(f'{name} is required')
+    value = parse_float(value)
+    if not low <= value <= high:
+        raise FilterError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def parse_nearest_args():
+    """(lat, lon, k) from the request args."""
+    check_args({'lat', 'lon', 'k'})
+    lat = _coordinate('lat', -90, 90)
+    lon = _coordinate('lon', -180, 180)
+    k = parse_int(request.args.get('k', str(DEFAULT_K)))
+    if k < 1:
+        raise FilterError('k must be a positive integer')
+    return lat, lon, min(k, MAX_K)
+
+
+def parse_within_args():
+    """(min_lon, min_lat, max_lon, max_lat, limit) from the request args;
+    `bbox` is given as west,south,east,north."""
+    check_args({'bbox', 'limit'})
+    bbox = request.args.get('bbox')
+    if bbox is None:
+        raise FilterError('bbox is required')
+    parts = bbox.split(',')
+    if len(parts) != 4:
+        raise FilterError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    min_lon, min_lat, max_lon, max_lat = (parse_float(part) for part in parts)
+    if min_lon > max_lon or min_lat > max_lat:
+        raise FilterError('bbox minimums must not exceed its maximums')
+
+    limit = parse_int(request.args.get('limit', str(DEFAULT_WITHIN_LIMIT)))
+    if limit < 1:
+        raise FilterError('limit must be a positive integer')
+    return min_lon, min_lat, max_lon, max_lat, min(limit, MAX_WITHIN_LIMIT)
@@ -0,0 +1,64 @@
+import itertools
+import json
+
+from flask import Response, request, stream_with_context
+
+from pagination import keyset_segments
+
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = 500
+
+
+def wants_stream():
+    """Streaming is requested with `?stream=true` or by accepting NDJSON."""
+    if wants_ndjson():
+        return True
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def wants_ndjson():
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def representation():
+    """How a collection is sent: as NDJSON, as a streamed JSON array
+    ('stream') or as a page of JSON ('json')."""
+    if wants_ndjson():
+        return 'ndjson'
+    return 'stream' if wants_stream() else 'json'
+
+
+def stream_query(query, *keys):
+    """Run `query` in keyset order (resuming after `cursor` if given) through
+    a server-side cursor, fetching STREAM_BATCH_SIZE rows at a time."""
+    segments, _ = keyset_segments(query, *keys)
+    return itertools.chain.from_iterable(segment.yield_per(STREAM_BATCH_SIZE) for segment in segments)
+
+
+def _json_array(items):
+    yield '['
+    first = True
+    for item in items:
+        if first:
+            first = False
+            yield json.dumps(item)
+        else:
+            yield ',' + json.dumps(item)
+    yield ']\n'
+
+
+def _ndjson(items):
+    for item in items:
+        yield json.dumps(item) + '\n'
+
+
+def stream_response(items):
+    """Encode the dicts produced by `items` one at a time, as NDJSON when the
+    client accepts it and as a JSON array otherwise."""
+    if wants_ndjson():
+        body, mimetype = _ndjson(items), NDJSON_MIMETYPE
+    else:
+        body, mimetype = _json_array(items), 'application/json'
+    return Response(stream_with_context(body), mimetype=mimetype)
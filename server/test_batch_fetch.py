@@ -0,0 +1,80 @@
+import pytest
+
+from filters import MAX_IDS
+from streaming import NDJSON_MIMETYPE
+
+
+def ids_of(payload):
+    return [row['id'] for row in payload['data'].values()]
+
+
+def test_rows_are_keyed_in_request_order(client):
+    payload = client.get('/trips?ids=7,2,11&include=').get_json()
+    assert list(payload['data']) == ['7', '2', '11']
+    assert ids_of(payload) == [7, 2, 11]
+    assert payload['missing'] == []
+
+
+def test_missing_ids_are_listed(client):
+    payload = client.get('/vehicles?ids=3,40,1,41').get_json()
+    assert ids_of(payload) == [3, 1]
+    assert payload['missing'] == [40, 41]
+
+
+def test_filters_narrow_the_ids(client):
+    # Vehicle 1's trips are 1 to 4.
+    payload = client.get('/trips?ids=5,1&vehicle_id=1&include=').get_json()
+    assert ids_of(payload) == [1]
+    assert payload['missing'] == [5]
+
+
+def test_duplicate_ids_are_fetched_once(client):
+    payload = client.get('/drivers?ids=2,1,2,1').get_json()
+    assert list(payload['data']) == ['2', '1']
+
+
+@pytest.mark.parametrize('ids', ['1,x', '1.5', ',', '1,,true'])
+def test_non_integer_ids_are_rejected(client, ids):
+    assert client.get(f'/drivers?ids={ids}').status_code == 400
+
+
+def test_too_many_ids_are_rejected(client):
+    ids = ','.join(map(str, range(1, MAX_IDS + 2)))
+    response = client.get(f'/drivers?ids={ids}')
+    assert response.status_code == 400
+    assert str(MAX_IDS) in response.get_json()['error']
+
+    response = client.post('/drivers/batch', json={'ids': list(range(1, MAX_IDS + 2))})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query, headers', [
+    ('ids=1&cursor=abc', {}),
+    ('ids=1&stream=true', {}),
+    ('ids=1', {'Accept': NDJSON_MIMETYPE}),
+    ('ids=1&since=0', {}),
+    ('ids=1&colour=red', {}),
+])
+def test_rejected_combinations(client, query, headers):
+    response = client.get(f'/trips?{query}', headers=headers)
+    assert response.status_code == 400
+
+
+def test_batch_post_matches_ids_arg(client):
+    response = client.post('/trips/batch?include=', json={'ids': [9, 99, 3]})
+    assert response.status_code == 200
+    assert response.get_json() == client.get('/trips?ids=9,99,3&include=').get_json()
+
+
+@pytest.mark.parametrize('body', [None, {}, {'ids': []}, {'ids': '1,2'}, {'ids': [1, True]}, [1, 2]])
+def test_batch_post_rejects_bad_bodies(client, body):
+    assert client.post('/trips/batch', json=body).status_code == 400
+
+
+def test_batch_post_is_validated_by_ids(client):
+    first = client.post('/trips/batch', json={'ids': [1, 2]})
+    other = client.post('/trips/batch', json={'ids': [2, 1]})
+    assert first.headers['ETag'] != other.headers['ETag']
+
+    response = client.post('/trips/batch', json={'ids': [1, 2]}, headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
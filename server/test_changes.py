@@ -0,0 +1,42 @@
+import datetime
+
+from models import db, Trip
+
+
+def test_changes_feed_lists_rows_without_related_rows(client):
+    response = client.get('/vehicles?since=0')
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert [row['id'] for row in payload['data']] == [1, 2, 3]
+    assert 'trips' not in payload['data'][0]
+    assert payload['deleted'] == []
+
+
+def test_changes_feed_rejects_include(client):
+    response = client.get('/vehicles?since=0&include=trips')
+    assert response.status_code == 400
+    assert 'include' in response.get_json()['error']
+
+    assert client.get('/vehicles?since=0&include=').status_code == 200
+    assert client.get('/vehicles?since=0&fields=id,trips.start_time').status_code == 400
+
+
+def test_related_changes_appear_in_their_own_feed(app, client):
+    vehicles = client.get('/vehicles?since=0').get_json()
+    trips = client.get('/trips?since=0').get_json()
+
+    with app.app_context():
+        start = datetime.datetime(2026, 3, 1, 8)
+        trip = Trip(vehicle_id=1, driver_id=1, route_id=1, start_time=start)
+        db.session.add(trip)
+        db.session.delete(db.session.get(Trip, 1))
+        db.session.commit()
+        added = trip.id
+
+    changed = client.get(f"/vehicles?since={vehicles['next_since']}").get_json()
+    assert changed['data'] == [] and changed['deleted'] == []
+
+    changed = client.get(f"/trips?since={trips['next_since']}").get_json()
+    assert [row['id'] for row in changed['data']] == [added]
+    assert changed['data'][0]['vehicle_id'] == 1
+    assert changed['deleted'] == [1]
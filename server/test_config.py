@@ -0,0 +1,39 @@
+import pytest
+
+from app import environment_config
+from cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, response_cache
+from conftest import build_app
+from passwords import DEFAULT_ROUNDS, password_hasher
+
+
+NUMERIC_SETTINGS = [
+    'RESPONSE_CACHE_TTL', 'RESPONSE_CACHE_MAX_ENTRIES', 'BCRYPT_LOG_ROUNDS', 'PASSWORD_HASH_WORKERS',
+    'PASSWORD_HASH_QUEUE', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_TIMEOUT', 'DB_POOL_RECYCLE',
+    'DB_POOL_WARMUP', 'DB_STATEMENT_TIMEOUT', 'REPLICA_MAX_LAG', 'REPLICA_LAG_CHECK_INTERVAL',
+]
+
+
+@pytest.fixture
+def environ(monkeypatch):
+    for name in NUMERIC_SETTINGS + ['RESPONSE_CACHE']:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_unset_settings_are_left_out(environ):
+    assert not set(NUMERIC_SETTINGS) & set(environment_config())
+
+
+def test_numeric_settings_are_parsed(environ):
+    for name in NUMERIC_SETTINGS:
+        environ.setenv(name, '7')
+    config = environment_config()
+    assert {name: config[name] for name in NUMERIC_SETTINGS} == dict.fromkeys(NUMERIC_SETTINGS, 7)
+
+
+def test_module_defaults_apply(environ):
+    app = build_app()
+    with app.app_context():
+        backend = response_cache.backend
+        assert (backend.max_entries, backend.ttl) == (DEFAULT_MAX_ENTRIES, DEFAULT_TTL)
+        assert password_hasher.rounds == DEFAULT_ROUNDS
@@ -0,0 +1,17 @@
+import itertools
+
+from fieldsets import PLAN_CACHE_SIZE, column_keys
+from loaders import loader_plan
+from models import Trip, Vehicle
+from serializers import compile_plan
+
+
+def test_plan_caches_stay_bounded(client):
+    columns = column_keys(Vehicle)[1:] + [f'trips.{key}' for key in column_keys(Trip)[1:]]
+    fieldsets = itertools.combinations(columns, 4)
+    for fields in itertools.islice(fieldsets, PLAN_CACHE_SIZE + 100):
+        response = client.get(f"/vehicles?include=trips&fields={','.join(fields)}")
+        assert response.status_code == 200, response.get_json()
+
+    assert loader_plan.cache_info().currsize <= PLAN_CACHE_SIZE
+    assert compile_plan.cache_info().currsize <= PLAN_CACHE_SIZE
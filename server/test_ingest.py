@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from sqlalchemy import text
+
+from models import db
+
+
+def trip(**values):
+    return {'start_time': '2026-03-01T08:00:00', 'driver_id': 1, 'vehicle_id': 1, 'route_id': 1, **values}
+
+
+def session(**values):
+    return {'start_time': '2026-02-05T08:00:00', 'end_time': '2026-02-05T09:00:00', 'energy_kwh': 10,
+            'vehicle_id': 1, **values}
+
+
+def post_ndjson(client, path, records):
+    body = ''.join(json.dumps(record) + '\n' for record in records)
+    return client.post(path, data=body, content_type='application/x-ndjson')
+
+
+def trip_count(client):
+    return len(client.get('/trips?include=&limit=100').get_json()['data'])
+
+
+def test_ndjson_body(client):
+    response = post_ndjson(client, '/trips/bulk', [trip(), trip(vehicle_id=2, driver_id=2)])
+    assert response.status_code == 200
+    assert response.get_json() == {'received': 2, 'inserted': 2, 'failed': 0, 'errors': []}
+    assert trip_count(client) == 14
+
+
+def test_json_array_body(client):
+    response = client.post('/trips/bulk', json=[trip(), trip(end_time='2026-03-01T09:00:00', completed=True)])
+    assert response.get_json()['inserted'] == 2
+    assert trip_count(client) == 14
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'json': {'start_time': '2026-03-01T08:00:00'}},
+    {'data': '[{', 'content_type': 'application/json'},
+    {'data': 'start_time=2026-03-01', 'content_type': 'text/plain'},
+])
+def test_unreadable_body_is_rejected(client, kwargs):
+    assert client.post('/trips/bulk', **kwargs).status_code == 400
+
+
+def test_invalid_rows_are_reported_and_skipped(client):
+    body = '\n'.join([
+        json.dumps(trip()),
+        '{"start_time": ',
+        json.dumps(trip(driver_id='1')),
+        json.dumps(trip(end_time='2026-03-01T07:00:00')),
+        json.dumps(trip(colour='red')),
+        json.dumps({'driver_id': 1, 'vehicle_id': 1, 'route_id': 1}),
+        json.dumps(trip(vehicle_id=99, route_id=99)),
+    ])
+    response = client.post('/trips/bulk', data=body, content_type='application/x-ndjson')
+
+    assert response.get_json() == {
+        'received': 7,
+        'inserted': 1,
+        'failed': 6,
+        'errors': [
+            {'row': 2, 'error': 'is not valid JSON'},
+            {'row': 3, 'error': 'driver_id must be an integer'},
+            {'row': 4, 'error': 'end_time must not be before start_time'},
+            {'row': 5, 'error': 'unknown fields: colour'},
+            {'row': 6, 'error': 'start_time is required'},
+            {'row': 7, 'error': 'vehicle_id, route_id not found'},
+        ],
+    }
+    assert trip_count(client) == 13
+
+
+def test_failed_chunk_is_rolled_back_alone(app, client):
+    with app.app_context():
+        db.session.execute(text(
+            'CREATE TRIGGER reject_session BEFORE INSERT ON charging_sessions WHEN NEW.energy_kwh = 13 '
+            "BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+        ))
+        db.session.commit()
+    energy = '/analytics/energy?from=2026-02-01&to=2026-02-28'
+    total = client.get(energy).get_json()['fleet']
+
+    records = [session(), session(), session(), session(energy_kwh=13), session()]
+    response = post_ndjson(client, '/charging-sessions/bulk?chunk_size=2', records)
+
+    report = response.get_json()
+    assert (report['inserted'], report['failed']) == (3, 2)
+    assert [error['row'] for error in report['errors']] == [3, 4]
+    assert all('rejected' in error['error'] for error in report['errors'])
+    # Only the sessions that were inserted count towards the rollups.
+    assert sum(row['energy_kwh'] for row in client.get(energy).get_json()['fleet']) == \
+        sum(row['energy_kwh'] for row in total) + 30
+
+
+def test_ingest_bumps_versions(client):
+    page = client.get('/trips')
+    feed = client.get('/trips?since=0').get_json()
+
+    client.post('/trips/bulk', json=[trip()])
+
+    response = client.get('/trips', headers={'If-None-Match': page.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != page.headers['ETag']
+    changed = client.get(f"/trips?since={feed['next_since']}").get_json()
+    assert [row['id'] for row in changed['data']] == [13]
+
+
+def test_charging_session_ingest_updates_energy_rollups(client):
+    energy = '/analytics/energy?from=2026-02-01&to=2026-02-28&granularity=day'
+    before = client.get(energy).get_json()
+
+    records = [session(vehicle_id=2, energy_kwh=12.5), session(vehicle_id=2, end_time=None)]
+    assert post_ndjson(client, '/charging-sessions/bulk', records).get_json()['inserted'] == 2
+
+    after = client.get(energy).get_json()
+    day = [row for row in after['fleet'] if row['period'] == '2026-02-05']
+    # The ongoing session is not counted until it ends.
+    assert [row['energy_kwh'] for row in day] == [12.5]
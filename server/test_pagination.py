@@ -0,0 +1,62 @@
+import base64
+import json
+
+import pytest
+
+from models import db, Trip
+from pagination import encode_cursor
+
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def walk(client, path, limit):
+    ids, cursor = [], None
+    while True:
+        query = f'{path}?include=&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        payload = client.get(query).get_json()
+        ids += [row['id'] for row in payload['data']]
+        cursor = payload['next_cursor']
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('limit', [1, 2, 5, 100])
+def test_pages_cover_every_row_once(app, client, limit):
+    with app.app_context():
+        # Trips without a start time come last.
+        db.session.add(Trip(vehicle_id=1, driver_id=1, route_id=1, start_time=None))
+        db.session.commit()
+        expected = [trip.id for trip in Trip.query.order_by(Trip.start_time.desc().nulls_last(), Trip.id.desc())]
+
+    assert walk(client, '/trips', limit) == expected
+    assert walk(client, '/vehicles', limit) == [1, 2, 3]
+
+
+@pytest.mark.parametrize('path, values', [
+    ('/vehicles', [None]),
+    ('/vehicles', [[1, 2]]),
+    ('/vehicles', [{'a': 1}]),
+    ('/vehicles', ['1']),
+    ('/vehicles', [True]),
+    ('/vehicles', [1, 2]),
+    ('/trips', [[1], [2]]),
+    ('/trips', [{'dt': '2026-02-01T08:00:00'}, None]),
+    ('/trips', [{'dt': 'yesterday'}, 1]),
+    ('/trips', [{'dt': '2026-02-01T08:00:00+03:00'}, 1]),
+    ('/trips', [{'dt': '2026-02-01T08:00:00', 'x': 1}, 1]),
+    ('/trips', [5, 1]),
+    ('/routes', [1, 1]),
+    ('/vehicles?since=0', [None, 1]),
+])
+def test_tampered_cursor_is_rejected(client, path, values):
+    separator = '&' if '?' in path else '?'
+    response = client.get(f'{path}{separator}cursor={raw_cursor(values)}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_cursor_inside_trailing_nulls_is_accepted(client):
+    response = client.get(f'/trips?cursor={encode_cursor([None, 10])}')
+    assert response.status_code == 200
@@ -0,0 +1,62 @@
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+from conftest import build_app, signed_in
+from models import db
+
+
+# The most statements each read resource may send from a fresh app: the
+# signed-in admin, the table versions and the queries of the resource's
+# loader plan (see loaders.py).
+MAX_QUERIES = {
+    '/vehicles': 7,
+    '/vehicles/1': 7,
+    '/drivers': 4,
+    '/drivers/1': 4,
+    '/charging-sessions': 6,
+    '/charging-sessions/1': 6,
+    '/maintenance-records': 6,
+    '/maintenance-records/1': 6,
+    '/trips': 6,
+    '/trips/1': 6,
+    '/routes': 3,
+    '/routes/1': 4,
+}
+
+
+@contextlib.contextmanager
+def count_queries(app):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+def queries(app, path):
+    client = signed_in(app.test_client())
+    with count_queries(app) as statements:
+        response = client.get(path)
+    assert response.status_code == 200, response.get_json()
+    return statements
+
+
+@pytest.mark.parametrize('path', MAX_QUERIES)
+def test_query_count(app, path):
+    statements = queries(app, path)
+    assert len(statements) <= MAX_QUERIES[path], '\n'.join(statements)
+
+
+@pytest.mark.parametrize('path', MAX_QUERIES)
+def test_query_count_does_not_grow_with_rows(app, path):
+    larger = build_app(vehicles=10, trips_per_vehicle=10)
+    assert len(queries(larger, path)) == len(queries(app, path))
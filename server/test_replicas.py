@@ -0,0 +1,174 @@
+import contextlib
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from conftest import TEST_CONFIG, build_app, signed_in
+from models import db
+
+
+def replicate(primary, replica):
+    """Stand in for replication: copy the primary's file over the replica."""
+    source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+@pytest.fixture
+def files(tmp_path):
+    primary, replica = str(tmp_path / 'primary.db'), str(tmp_path / 'replica.db')
+    build_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}'})
+    replicate(primary, replica)
+    return primary, replica
+
+
+def replicated_app(files, **config):
+    primary, replica = files
+    return create_app({
+        **TEST_CONFIG,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'REPLICA_DATABASE_URIS': [f'sqlite:///{replica}'],
+        'REPLICA_LAG_CHECK_INTERVAL': 0,
+        **config,
+    })
+
+
+@pytest.fixture
+def app(files):
+    # Replicas stay in use however far behind, so only the routing of
+    # each client's own writes sends reads to the primary.
+    return replicated_app(files, REPLICA_MAX_LAG=3600)
+
+
+@contextlib.contextmanager
+def databases_read(app):
+    """The binds ('primary' or a replica key) the block read vehicles from."""
+    binds = set()
+    with app.app_context():
+        engines = {key or 'primary': engine for key, engine in db.engines.items()}
+
+    listeners = []
+    for name, engine in engines.items():
+        def record(conn, cursor, statement, parameters, context, executemany, name=name):
+            if statement.startswith('SELECT') and 'FROM vehicles' in statement:
+                binds.add(name)
+        event.listen(engine, 'before_cursor_execute', record)
+        listeners.append((engine, record))
+    try:
+        yield binds
+    finally:
+        for engine, record in listeners:
+            event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_get_reads_from_replica(app):
+    client = signed_in(app.test_client())
+    with databases_read(app) as binds:
+        assert client.get('/vehicles/1').status_code == 200
+    assert binds == {'replica_1'}
+
+
+def test_client_reads_its_writes_until_replica_catches_up(app, files):
+    writer, other = signed_in(app.test_client()), signed_in(app.test_client())
+
+    response = writer.patch('/vehicles/status', json={'maintenance': [1]})
+    assert response.status_code == 200
+
+    with databases_read(app) as binds:
+        assert writer.get('/vehicles/1').get_json()['current_status'] == 'maintenance'
+    assert binds == {'primary'}
+    with databases_read(app) as binds:
+        assert other.get('/vehicles/1').get_json()['current_status'] == 'idle'
+    assert binds == {'replica_1'}
+
+    replicate(*files)
+    with databases_read(app) as binds:
+        assert writer.get('/vehicles/1').get_json()['current_status'] == 'maintenance'
+    assert binds == {'replica_1'}
+    with writer.session_transaction() as session:
+        assert 'written_versions' not in session
+
+
+def test_signed_up_admin_is_authenticated_before_replica_catches_up(app):
+    client = app.test_client()
+    response = client.post('/signup', json={'email': 'new@example.com', 'password': 'secret'})
+    assert response.status_code == 201
+
+    response = client.get('/check-session')
+    assert response.status_code == 200
+    assert response.get_json()['email'] == 'new@example.com'
+
+
+def test_other_clients_see_new_admin_authenticated(app):
+    signup = app.test_client()
+    admin = signup.post('/signup', json={'email': 'new@example.com', 'password': 'secret'}).get_json()
+
+    # A new client signed in as that admin has written nothing itself.
+    client = signed_in(app.test_client(), admin['id'])
+    assert client.get('/check-session').status_code == 200
+
+
+def test_lagging_replica_is_passed_over(files):
+    app = replicated_app(files, REPLICA_MAX_LAG=0)
+    writer, other = signed_in(app.test_client()), signed_in(app.test_client())
+    writer.patch('/vehicles/status', json={'maintenance': [1]})
+
+    with databases_read(app) as binds:
+        assert other.get('/vehicles/1').get_json()['current_status'] == 'maintenance'
+    assert binds == {'primary'}
+
+
+def test_unreachable_replica_falls_back_to_primary(files, tmp_path):
+    primary, _ = files
+    app = create_app({
+        **TEST_CONFIG,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'REPLICA_DATABASE_URIS': [f'sqlite:///{tmp_path}/missing/replica.db'],
+    })
+    client = signed_in(app.test_client())
+
+    with databases_read(app) as binds:
+        assert client.get('/vehicles/1').status_code == 200
+    assert binds == {'primary'}
+    assert client.get('/replica-stats').get_json() == {'replica_1': {'lag_seconds': None, 'in_use': False}}
+
+
+def test_slow_replica_check_does_not_hold_up_other_reads(app):
+    router = app.extensions['replica_router']
+    with app.app_context():
+        assert router.choose() == 'replica_1'
+        engine = db.engines['replica_1']
+
+    blocked, release = threading.Event(), threading.Event()
+
+    def stall(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM table_versions' in statement:
+            blocked.set()
+            release.wait(5)
+
+    def check():
+        with app.app_context():
+            router.choose()
+
+    event.listen(engine, 'before_cursor_execute', stall)
+    checking = threading.Thread(target=check)
+    checking.start()
+    try:
+        assert blocked.wait(5)
+        # Served from the last check while the next one waits on the replica.
+        chosen = []
+        reader = threading.Thread(target=lambda: chosen.append(router.choose()))
+        reader.start()
+        reader.join(1)
+        assert chosen == ['replica_1']
+        assert router.to_dict()['replica_1']['in_use']
+    finally:
+        release.set()
+        checking.join()
+        event.remove(engine, 'before_cursor_execute', stall)
@@ -0,0 +1,48 @@
+import pytest
+
+from cache import response_cache
+
+
+REPORTS = [
+    '/analytics/energy?from=2026-01-25&to=2026-02-10',
+    '/analytics/utilization?from=2026-01-31T00:00:00&to=2026-02-02T00:00:00',
+    '/analytics/charging-load?from=2026-01-31T00:00:00&to=2026-02-02T00:00:00',
+    '/availability?from=2026-02-01T08:00:00&to=2026-02-01T09:00:00',
+]
+
+
+@pytest.mark.parametrize('path', REPORTS)
+def test_report_is_cached_and_validated(app, client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    assert client.get(path).get_json() == response.get_json()
+    with app.app_context():
+        assert response_cache.stats.to_dict()['hits'] == 1
+
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+
+
+@pytest.mark.parametrize('path', REPORTS + [
+    '/dashboard?limit=5',
+    '/routes/nearest?lat=-1.28&lon=36.81',
+    '/routes/within?bbox=36.5,-1.5,37.5,-1',
+])
+def test_unknown_args_are_rejected(client, path):
+    response = client.get(f'{path}&colour=red')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Unsupported filter: colour'}
+
+
+def test_energy_report_sums_completed_sessions(client):
+    report = client.get(REPORTS[0]).get_json()
+    # Three vehicles with a 20 kWh session on each of two days.
+    assert sum(row['energy_kwh'] for row in report['vehicles']) == 120
+
+
+def test_availability_excludes_busy_vehicles_and_drivers(client):
+    # Every vehicle and driver has a trip from 08:00 to 08:30.
+    assert client.get(REPORTS[3]).get_json() == {'drivers': [], 'vehicles': []}
+    report = client.get('/availability?from=2026-02-01T06:00:00&to=2026-02-01T07:00:00').get_json()
+    assert [vehicle['id'] for vehicle in report['vehicles']] == [1, 2, 3]
@@ -0,0 +1,135 @@
+import datetime
+
+import pytest
+
+from cache import RedisBackend, response_cache
+from conftest import build_app, signed_in
+from models import db, Admin, ChargingSession
+
+
+class StandInRedis:
+    """The Redis commands RedisBackend uses, in memory. Expiry is ignored."""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode('utf-8') if isinstance(value, str) else value
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(member.encode('utf-8') for member in members)
+
+    def expire(self, key, seconds):
+        pass
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def app(request):
+    app = build_app()
+    if request.param == 'redis':
+        with app.app_context():
+            response_cache.backend = RedisBackend(response_cache.stats, client=StandInRedis())
+    return app
+
+
+def stats(app):
+    with app.app_context():
+        return response_cache.stats.to_dict()
+
+
+def get(app, client, path):
+    """The response to `path`, and whether it came from the cache."""
+    hits = stats(app)['hits']
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.get_json(), stats(app)['hits'] > hits
+
+
+def test_repeated_request_is_served_from_cache(app):
+    client = signed_in(app.test_client())
+    first, cached = get(app, client, '/routes')
+    assert not cached
+    second, cached = get(app, client, '/routes')
+    assert cached
+    assert second == first
+
+
+def test_entries_are_per_admin(app):
+    with app.app_context():
+        db.session.add(Admin(email='other@example.com', _password_hash='x'))
+        db.session.commit()
+    get(app, signed_in(app.test_client()), '/routes')
+    _, cached = get(app, signed_in(app.test_client(), admin_id=2), '/routes')
+    assert not cached
+
+
+def test_commit_invalidates_only_dependent_entries(app):
+    client = signed_in(app.test_client())
+    before, _ = get(app, client, '/charging-sessions')
+    for path in ('/vehicles/1', '/routes'):
+        get(app, client, path)
+
+    with app.app_context():
+        start = datetime.datetime(2026, 3, 1, 8)
+        db.session.add(ChargingSession(vehicle_id=1, start_time=start, end_time=start + datetime.timedelta(hours=1), energy_kwh=5))
+        db.session.commit()
+    assert stats(app)['invalidations'] == 2
+
+    after, cached = get(app, client, '/charging-sessions')
+    assert not cached
+    assert len(after['data']) == len(before['data']) + 1
+    _, cached = get(app, client, '/vehicles/1')
+    assert not cached
+    _, cached = get(app, client, '/routes')
+    assert cached
+
+
+def test_least_recently_used_entry_is_evicted():
+    app = build_app({'RESPONSE_CACHE_MAX_ENTRIES': 2})
+    client = signed_in(app.test_client())
+    for path in ('/routes', '/drivers', '/routes', '/trips'):
+        get(app, client, path)
+
+    assert stats(app)['evictions'] == 1
+    _, cached = get(app, client, '/routes')
+    assert cached
+    _, cached = get(app, client, '/drivers')
+    assert not cached
+
+
+def test_expired_entry_is_not_served():
+    app = build_app({'RESPONSE_CACHE_TTL': 0})
+    client = signed_in(app.test_client())
+    get(app, client, '/routes')
+    _, cached = get(app, client, '/routes')
+
+    assert not cached
+    assert stats(app)['expirations'] == 1
+
+
+def test_cache_stats_endpoint(app):
+    client = signed_in(app.test_client())
+    get(app, client, '/routes')
+    get(app, client, '/routes')
+
+    response = client.get('/cache-stats')
+    assert response.status_code == 200
+    assert {'hits': 1, 'misses': 1, 'sets': 1}.items() <= response.get_json().items()
@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+from sqlalchemy import text
+
+from models import db, ChargingSession, EnergyRollup, Vehicle
+from rollups import backfill
+
+
+@pytest.fixture
+def session(app):
+    with app.app_context():
+        # As on PostgreSQL, so energy_rollups rows go with their vehicle.
+        db.session.execute(text('PRAGMA foreign_keys=ON'))
+        yield db.session
+
+
+def rollups(session):
+    return {
+        (row.vehicle_id, row.day.isoformat()): (row.energy_kwh, row.session_count)
+        for row in session.query(EnergyRollup)
+    }
+
+
+def add_session(session, vehicle_id, start, hours=1, energy_kwh=5):
+    charging = ChargingSession(vehicle_id=vehicle_id, start_time=start, energy_kwh=energy_kwh,
+                               end_time=start + datetime.timedelta(hours=hours) if hours is not None else None)
+    session.add(charging)
+    session.commit()
+    return charging
+
+
+def test_rollups_follow_session_changes(session):
+    assert rollups(session)[(1, '2026-02-01')] == (20, 1)
+
+    charging = session.get(Vehicle, 1).charging_sessions
+    charging[0].energy_kwh = 25
+    start = datetime.datetime(2026, 2, 1, 12)
+    session.add(ChargingSession(vehicle_id=1, start_time=start, end_time=start + datetime.timedelta(hours=1), energy_kwh=5))
+    session.commit()
+    assert rollups(session)[(1, '2026-02-01')] == (30, 2)
+
+    session.delete(charging[1])
+    session.commit()
+    assert (1, '2026-02-02') not in rollups(session)
+
+
+def test_deleting_vehicle_with_sessions_drops_its_rollups(session):
+    session.delete(session.get(Vehicle, 1))
+    session.commit()
+
+    assert {vehicle_id for vehicle_id, _ in rollups(session)} == {2, 3}
+
+
+def test_closing_an_open_session_counts_it(session):
+    start = datetime.datetime(2026, 2, 3, 8)
+    charging = add_session(session, 1, start, hours=None)
+    assert (1, '2026-02-03') not in rollups(session)
+
+    charging.end_time = start + datetime.timedelta(hours=2)
+    session.commit()
+    assert rollups(session)[(1, '2026-02-03')] == (5, 1)
+
+    charging.end_time = None
+    session.commit()
+    assert (1, '2026-02-03') not in rollups(session)
+
+
+def test_deleting_sessions_takes_them_out(session):
+    start = datetime.datetime(2026, 2, 1, 12)
+    added = add_session(session, 2, start)
+    open_session = add_session(session, 2, start, hours=None)
+    assert rollups(session)[(2, '2026-02-01')] == (25, 2)
+
+    session.delete(open_session)
+    session.commit()
+    assert rollups(session)[(2, '2026-02-01')] == (25, 2)
+
+    session.delete(added)
+    session.commit()
+    assert rollups(session)[(2, '2026-02-01')] == (20, 1)
+
+
+def test_backfill_matches_incremental_rollups(session):
+    start = datetime.datetime(2026, 2, 4, 22)
+    add_session(session, 1, start, energy_kwh=7)
+    moved = add_session(session, 2, start, energy_kwh=3)
+    closed = add_session(session, 3, start, hours=None, energy_kwh=11)
+    moved.vehicle_id, moved.start_time = 3, start + datetime.timedelta(days=1)
+    closed.end_time = start + datetime.timedelta(hours=3)
+    session.delete(session.get(Vehicle, 2).charging_sessions[0])
+    session.commit()
+
+    incremental = rollups(session)
+    backfill(session)
+    session.commit()
+    assert rollups(session) == incremental
@@ -0,0 +1,29 @@
+import pytest
+
+from models import db, Route
+
+
+def add_equator_routes(app, east, west):
+    """Routes along the equator every 10 degrees of longitude, plus 'East'
+    and 'West' at the longitudes given."""
+    with app.app_context():
+        for name, lon in [*((f'Equator {lon}', lon) for lon in range(-170, 180, 10)), ('East', east), ('West', west)]:
+            db.session.add(Route(name=name, start_latitude=0, start_longitude=lon, end_latitude=0, end_longitude=lon))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('east, west, lon, name', [
+    (179.0, -179.95, 179.9, 'West'),
+    (179.95, -179.0, -179.9, 'East'),
+])
+def test_nearest_route_is_across_the_antimeridian(app, client, east, west, lon, name):
+    add_equator_routes(app, east, west)
+    routes = client.get(f'/routes/nearest?lat=0&lon={lon}&k=1').get_json()['data']
+    assert [route['name'] for route in routes] == [name]
+
+
+def test_nearest_routes_on_both_sides_of_the_antimeridian(app, client):
+    add_equator_routes(app, 179.95, -179.95)
+    routes = client.get('/routes/nearest?lat=0&lon=-179&k=3').get_json()['data']
+    assert [route['name'] for route in routes] == ['West', 'East', 'Equator -170']
+    assert routes[1]['distance_km'] == pytest.approx(116.8, abs=0.1)
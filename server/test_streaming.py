@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from streaming import NDJSON_MIMETYPE
+
+
+def test_ndjson_lists_every_row(client):
+    response = client.get('/trips', headers={'Accept': NDJSON_MIMETYPE})
+    assert response.mimetype == NDJSON_MIMETYPE
+    trips = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(trip['id'] for trip in trips) == list(range(1, 13))
+
+
+def test_streamed_array_lists_every_row(client):
+    response = client.get('/trips?stream=true')
+    assert response.mimetype == 'application/json'
+    assert len(response.get_json()) == 12
+
+
+@pytest.mark.parametrize('path, headers', [
+    ('/trips', {'Accept': NDJSON_MIMETYPE}),
+    ('/trips?stream=true', {}),
+])
+def test_representations_have_their_own_etag(client, path, headers):
+    page = client.get('/trips')
+    assert 'Accept' in page.headers['Vary']
+
+    response = client.get(path, headers={**headers, 'If-None-Match': page.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != page.headers['ETag']
+    assert 'Accept' in response.headers['Vary']
+
+    response = client.get(path, headers={**headers, 'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert 'Accept' in response.headers['Vary']
@@ -0,0 +1,36 @@
+import datetime
+
+import pytest
+
+from filters import local_time
+from models import LOCAL_TIMEZONE
+
+
+def test_local_time_converts_aware_values():
+    value = datetime.datetime(2026, 2, 1, 10, tzinfo=datetime.timezone.utc)
+    assert local_time(value) == datetime.datetime(2026, 2, 1, 13)
+
+
+def test_local_time_keeps_naive_values():
+    value = datetime.datetime(2026, 2, 1, 10)
+    assert local_time(value) == value
+
+
+def test_local_time_keeps_local_offsets():
+    value = LOCAL_TIMEZONE.localize(datetime.datetime(2026, 7, 1, 9))
+    assert local_time(value) == datetime.datetime(2026, 7, 1, 9)
+
+
+@pytest.mark.parametrize('query, found', [
+    ('start_time_from=2026-02-01T10:00:00Z&start_time_to=2026-02-01T11:00:00Z', True),
+    ('start_time_from=2026-02-01T13:00:00&start_time_to=2026-02-01T14:00:00', True),
+    ('start_time_from=2026-02-01T13:00:00%2B03:00&start_time_to=2026-02-01T14:00:00%2B03:00', True),
+    ('start_time_from=2026-02-01T13:00:00Z&start_time_to=2026-02-01T14:00:00Z', False),
+])
+def test_ingested_utc_trip_matches_filters_in_any_offset(client, query, found):
+    trip = {'start_time': '2026-02-01T10:00:00Z', 'driver_id': 1, 'vehicle_id': 1, 'route_id': 1}
+    response = client.post('/trips/bulk', json=[trip])
+    assert response.get_json()['inserted'] == 1
+
+    trips = client.get(f'/trips?{query}&include=').get_json()['data']
+    assert [trip['start_time'] for trip in trips] == (['2026-02-01 13:00:00'] if found else [])
@@ -0,0 +1,31 @@
+import datetime
+
+from models import db, Trip
+
+
+WINDOW = 'from=2026-02-10T00:00:00&to=2026-02-11T00:00:00'
+
+
+def add_trip(app, vehicle_id, start_time, end_time=None):
+    with app.app_context():
+        db.session.add(Trip(vehicle_id=vehicle_id, driver_id=vehicle_id, route_id=1, completed=end_time is not None,
+                            start_time=start_time, end_time=end_time))
+        db.session.commit()
+
+
+def busy_hours(client):
+    report = client.get(f'/analytics/utilization?{WINDOW}').get_json()
+    return {vehicle['vehicle_id']: vehicle['busy_hours'] for vehicle in report['vehicles']}
+
+
+def test_ongoing_trip_started_long_before_window_is_busy(app, client):
+    add_trip(app, 1, datetime.datetime(2026, 2, 7, 9))
+
+    assert busy_hours(client) == {1: 24.0}
+    availability = client.get(f'/availability?{WINDOW}').get_json()
+    assert 1 not in [vehicle['id'] for vehicle in availability['vehicles']]
+
+
+def test_completed_trip_is_clipped_to_window(app, client):
+    add_trip(app, 2, datetime.datetime(2026, 2, 9, 20), datetime.datetime(2026, 2, 10, 2))
+    assert busy_hours(client) == {2: 2.0}
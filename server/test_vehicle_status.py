@@ -0,0 +1,46 @@
+import pytest
+
+
+def statuses(client):
+    return {vehicle['id']: vehicle['current_status'] for vehicle in client.get('/vehicles?include=').get_json()['data']}
+
+
+def test_updated_unchanged_and_not_found(client):
+    response = client.patch('/vehicles/status', json={'maintenance': [1, 99], 'idle': [2]})
+    assert response.status_code == 200
+    assert response.get_json() == {'updated': [1], 'unchanged': [2], 'not_found': [99]}
+    assert statuses(client) == {1: 'maintenance', 2: 'idle', 3: 'idle'}
+
+
+# Each body but the first two also sets a valid status for vehicle 2.
+@pytest.mark.parametrize('body', [
+    None,
+    {},
+    {'active': [2], 'parked': [1]},
+    {'active': [2], 'idle': 1},
+    {'active': [2], 'idle': [True]},
+    {'active': [2], 'idle': ['1']},
+    {'active': [2], 'idle': [2]},
+])
+def test_invalid_bodies_write_nothing(client, body):
+    response = client.patch('/vehicles/status', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert statuses(client) == {1: 'idle', 2: 'idle', 3: 'idle'}
+
+
+def test_update_invalidates_cached_vehicles(client):
+    page = client.get('/vehicles')
+    etag = page.headers['ETag']
+    assert client.get('/vehicles', headers={'If-None-Match': etag}).status_code == 304
+
+    # Nothing changes, so the version stays and the ETag still matches.
+    client.patch('/vehicles/status', json={'idle': [1]})
+    assert client.get('/vehicles', headers={'If-None-Match': etag}).status_code == 304
+
+    client.patch('/vehicles/status', json={'active': [3]})
+    response = client.get('/vehicles', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['data'][2]['current_status'] == 'active'
+    assert client.get('/cache-stats').get_json()['invalidations'] == 1
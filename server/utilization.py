@@ -0,0 +1,196 @@
+import datetime
+
+import numpy as np
+from flask import request
+from sqlalchemy import BigInteger, Integer, cast, func, select, union_all
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from models import db, Trip, LOCAL_TIMEZONE
+from filters import FilterError, check_args, parse_datetime, local_time
+from serializers import DATETIME_FORMAT
+
+
+UTILIZATION_TABLES = frozenset({Trip.__table__.name})
+
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 366
+
+# Completed trips starting this long before the window are not read, which
+# keeps the query a range scan on start_time. Ongoing trips are always read.
+MAX_TRIP_DURATION = datetime.timedelta(days=1)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+SECONDS_PER_HOUR = 3600.0
+SECONDS_PER_DAY = 86400.0
+
+
+def _now():
+    return datetime.datetime.now(LOCAL_TIMEZONE).replace(tzinfo=None, second=0, microsecond=0)
+
+
+def parse_window(default_days=DEFAULT_WINDOW_DAYS, max_days=MAX_WINDOW_DAYS):
+    """The (start, end) of a window from the `from` and `to` request args.
+    The end never lies in the future and defaults to now; the start defaults
+    to `default_days` before it."""
+    now = _now()
+    end = request.args.get('to')
+    end = min(local_time(parse_datetime(end)), now) if end else now
+    start = request.args.get('from')
+    start = local_time(parse_datetime(start)) if start else end - datetime.timedelta(days=default_days)
+
+    if start >= end:
+        raise FilterError('from must be before to')
+    if end - start > datetime.timedelta(days=max_days):
+        raise FilterError(f'The window must not exceed {max_days} days')
+    return start, end
+
+
+def parse_utilization_args():
+    """The (start, end) of the window; see parse_window."""
+    check_args({'from', 'to'})
+    return parse_window()
+
+
+class epoch_seconds(FunctionElement):
+    """Whole seconds since 1970-01-01 of a naive DateTime, computed by the
+    database so rows arrive as plain integers."""
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(epoch_seconds)
+def _compile_epoch_seconds(element, compiler, **kw):
+    return f'CAST(EXTRACT(EPOCH FROM {compiler.process(element.clauses, **kw)}) AS BIGINT)'
+
+
+@compiles(epoch_seconds, 'sqlite')
+def _compile_epoch_seconds_sqlite(element, compiler, **kw):
+    return compiler.process(cast(func.strftime('%s', *element.clauses), BigInteger), **kw)
+
+
+def _fetch(start, end):
+    """Columns of the trips overlapping [start, end) as arrays, with times in
+    seconds from `start`. Ongoing trips end at the end of the window."""
+    # A Core statement on the session's connection: no ORM row handling and
+    # no datetime parsing for what can be hundreds of thousands of rows.
+    columns = (
+        Trip.vehicle_id,
+        Trip.driver_id,
+        epoch_seconds(Trip.start_time),
+        epoch_seconds(Trip.end_time),
+        cast(Trip.completed, Integer),
+    )
+    completed = select(*columns).where(
+        Trip.start_time >= start - MAX_TRIP_DURATION,
+        Trip.start_time < end,
+        Trip.end_time > start,
+    )
+    ongoing = select(*columns).where(Trip.end_time.is_(None), Trip.start_time < end)
+    rows = db.session.connection().execute(union_all(completed, ongoing)).fetchall()
+    if not rows:
+        return None
+
+    # One array per column; NULLs (ongoing trips, unset flags) become NaN.
+    columns = [np.array(column, dtype=np.float64) for column in zip(*rows)]
+    origin = (start - EPOCH).total_seconds()
+    window = int((end - start).total_seconds())
+
+    starts = (columns[2] - origin).astype(np.int64)
+    has_end = ~np.isnan(columns[3])
+    ends = np.where(has_end, columns[3] - origin, window).astype(np.int64)
+
+    return {
+        'vehicle_id': columns[0].astype(np.int64),
+        'driver_id': columns[1].astype(np.int64),
+        'start': starts,
+        'end': np.maximum(ends, starts),
+        'finished': has_end & (columns[4] == 1),
+    }
+
+
+def _group_stats(key, keys, start, end, finished, window):
+    """Utilization per distinct value of `keys` (reported as `key`), computed
+    over whole arrays (one row per trip) rather than per trip."""
+    ids, groups = np.unique(keys, return_inverse=True)
+    n = len(ids)
+
+    # Busy time is the union of a group's trips clipped to the window. With
+    # rows sorted by (group, start), a trip opens a new busy block unless it
+    # starts before the furthest end seen so far in its group; offsetting each
+    # group by more than the window keeps the running maximum per group.
+    clipped_start = np.clip(start, 0, window)
+    clipped_end = np.clip(end, 0, window)
+    order = np.lexsort((clipped_start, groups))
+    g, s, e = groups[order], clipped_start[order], clipped_end[order]
+
+    offset = g * (window + 1)
+    reach = np.maximum.accumulate(e + offset) - offset
+    opens_block = np.ones(len(g), dtype=bool)
+    opens_block[1:] = (g[1:] != g[:-1]) | (s[1:] > reach[:-1])
+
+    first = np.flatnonzero(opens_block)
+    block_group = g[first]
+    block_start = s[first]
+    block_end = np.maximum.reduceat(e, first)
+    busy = np.bincount(block_group, weights=block_end - block_start, minlength=n)
+
+    # Idle gaps are the time between consecutive busy blocks of a group.
+    same_group = block_group[1:] == block_group[:-1]
+    gaps = (block_start[1:] - block_end[:-1])[same_group]
+    gap_group = block_group[1:][same_group]
+    gap_count = np.bincount(gap_group, minlength=n)
+    longest_gap = np.zeros(n)
+    np.maximum.at(longest_gap, gap_group, gaps)
+
+    # Trips per day and median duration count the trips starting in the
+    # window; the median only the completed ones.
+    started = (start >= 0) & (start < window)
+    trip_count = np.bincount(groups[started], minlength=n)
+
+    done = started & finished
+    duration_group = groups[done]
+    durations = (end - start)[done]
+    order = np.lexsort((durations, duration_group))
+    durations = durations[order]
+    counts = np.bincount(duration_group, minlength=n)
+    offsets = np.cumsum(counts) - counts
+    last = max(len(durations) - 1, 0)
+    low = np.minimum(offsets + (counts - 1) // 2, last)
+    high = np.minimum(offsets + counts // 2, last)
+    median = (durations[low] + durations[high]) / 2 if len(durations) else np.zeros(n)
+
+    days = window / SECONDS_PER_DAY
+    return [
+        {
+            key: id,
+            'busy_hours': round(busy_s / SECONDS_PER_HOUR, 3),
+            'idle_hours': round((window - busy_s) / SECONDS_PER_HOUR, 3),
+            'utilization': round(busy_s / window, 4),
+            'idle_gaps': gaps_n,
+            'longest_idle_gap_hours': round(longest_s / SECONDS_PER_HOUR, 3),
+            'trips': trips_n,
+            'trips_per_day': round(trips_n / days, 3),
+            'median_trip_hours': round(median_s / SECONDS_PER_HOUR, 3) if count else None,
+        }
+        for id, busy_s, gaps_n, longest_s, trips_n, median_s, count in zip(
+            ids.tolist(), busy.tolist(), gap_count.tolist(), longest_gap.tolist(),
+            trip_count.tolist(), np.asarray(median, dtype=float).tolist(), counts.tolist(),
+        )
+    ]
+
+
+def utilization_report(start, end):
+    """Busy and idle time, trips per day and median trip duration per vehicle
+    and per driver over [start, end). Vehicles and drivers without trips in
+    the window are left out."""
+    report = {'from': start.strftime(DATETIME_FORMAT), 'to': end.strftime(DATETIME_FORMAT), 'vehicles': [], 'drivers': []}
+
+    trips = _fetch(start, end)
+    if trips is None:
+        return report
+
+    window = int((end - start).total_seconds())
+    for name, key in (('vehicles', 'vehicle_id'), ('drivers', 'driver_id')):
+        report[name] = _group_stats(key, trips[key], trips['start'], trips['end'], trips['finished'], window)
+    return report
@@ -0,0 +1,73 @@
+from sqlalchemy import func, select, update
+
+from models import db, Vehicle
+from versions import bump_versions
+
+
+VEHICLE_TABLE = Vehicle.__table__
+
+MAX_VEHICLES = 10000
+
+
+class StatusUpdateError(ValueError):
+    pass
+
+
+def parse_status_changes(payload):
+    """{status: [vehicle ids]} from the request body, checked against
+    Vehicle.STATUS_CHOICES before anything is written."""
+    if not isinstance(payload, dict) or not payload:
+        raise StatusUpdateError('The body must map statuses to lists of vehicle ids')
+
+    changes = {}
+    seen = set()
+    for status, ids in payload.items():
+        if status not in Vehicle.STATUS_CHOICES:
+            raise StatusUpdateError(f"Invalid status '{status}', must be one of {Vehicle.STATUS_CHOICES}")
+        if not isinstance(ids, list) or any(isinstance(i, bool) or not isinstance(i, int) for i in ids):
+            raise StatusUpdateError(f"'{status}' must be a list of vehicle ids")
+        repeated = seen.intersection(ids)
+        if repeated:
+            raise StatusUpdateError(f'Vehicles given more than one status: {sorted(repeated)}')
+        seen.update(ids)
+        changes[status] = sorted(set(ids))
+
+    if len(seen) > MAX_VEHICLES:
+        raise StatusUpdateError(f'At most {MAX_VEHICLES} vehicles can be updated at once')
+    return changes
+
+
+def apply_status_changes(changes):
+    """Set the status of the vehicles in `changes` with one UPDATE per status
+    in the session's transaction. Vehicles already in their target status
+    are left alone. Returns the updated, unchanged and unknown ids."""
+    ids = [i for status_ids in changes.values() for i in status_ids]
+    current = dict(db.session.execute(select(Vehicle.id, Vehicle.current_status).where(Vehicle.id.in_(ids))).all())
+
+    pending = {
+        status: [i for i in status_ids if i in current and current[i] != status]
+        for status, status_ids in changes.items()
+    }
+    updated = []
+    if any(pending.values()):
+        # Core statements skip the unit of work, so stamp the version here.
+        version = bump_versions(db.session, [VEHICLE_TABLE.name])[VEHICLE_TABLE.name]
+        connection = db.session.connection()
+        for status, status_ids in pending.items():
+            if not status_ids:
+                continue
+            result = connection.execute(
+                update(VEHICLE_TABLE)
+                .where(VEHICLE_TABLE.c.id.in_(status_ids), VEHICLE_TABLE.c.current_status != status)
+                .values(current_status=status, updated_at=func.now(), change_seq=version)
+                .returning(VEHICLE_TABLE.c.id)
+            )
+            updated.extend(result.scalars())
+
+    updated = sorted(updated)
+    changed = set(updated)
+    return {
+        'updated': updated,
+        'unchanged': sorted(i for i in ids if i in current and i not in changed),
+        'not_found': sorted(i for i in ids if i not in current),
+    }
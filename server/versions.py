@@ -0,0 +1,187 @@
+import datetime
+import functools
+import hashlib
+
+from flask import Response, request
+from werkzeug.http import http_date
+from sqlalchemy import event, inspect, insert, select, update
+from sqlalchemy.orm import Session, object_session
+
+from models import db, TableVersion, Tombstone
+from fieldsets import include_tree
+
+
+VERSION_TABLE = TableVersion.__table__
+TOMBSTONE_TABLE = Tombstone.__table__
+
+# Callbacks run after each commit with the {table_name: version} it wrote.
+commit_listeners = []
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _bump(connection, tables):
+    now = _utcnow()
+    versions = {}
+    # A fixed order keeps concurrent writers from deadlocking on these rows.
+    for name in sorted(tables):
+        result = connection.execute(
+            update(VERSION_TABLE)
+            .where(VERSION_TABLE.c.table_name == name)
+            .values(version=VERSION_TABLE.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(VERSION_TABLE).values(table_name=name, version=1, updated_at=now))
+            versions[name] = 1
+        else:
+            versions[name] = connection.execute(
+                select(VERSION_TABLE.c.version).where(VERSION_TABLE.c.table_name == name)
+            ).scalar_one()
+    return versions
+
+
+def _record(session, versions):
+    changed = session.info.setdefault('changed_tables', {})
+    for name, version in versions.items():
+        changed[name] = max(version, changed.get(name, 0))
+
+
+def bump_versions(session, tables):
+    """Increment the version of `tables` within the session's transaction and
+    return the new {table_name: version}.
+
+    Called automatically for ORM flushes; bulk statements that bypass the
+    unit of work must call it themselves and write the returned version to
+    the `change_seq` of the rows they touch.
+    """
+    if not tables:
+        return {}
+
+    versions = _bump(session.connection(), tables)
+    _record(session, versions)
+    return versions
+
+
+def _tracked(mapper):
+    return 'change_seq' in mapper.columns
+
+
+def _flush_version(session, connection, table):
+    # Every row a flush writes to a table is stamped with the same version.
+    # The version row stays locked until commit, so versions of one table
+    # become visible strictly in order.
+    versions = session.info.setdefault('flush_versions', {})
+    if table.name not in versions:
+        versions.update(_bump(connection, [table.name]))
+        _record(session, {table.name: versions[table.name]})
+    return versions[table.name]
+
+
+def _before_insert(mapper, connection, target):
+    if _tracked(mapper):
+        target.change_seq = _flush_version(object_session(target), connection, mapper.local_table)
+
+
+def _before_update(mapper, connection, target):
+    # Also fires for dirty objects without net column changes.
+    session = object_session(target)
+    if _tracked(mapper) and session.is_modified(target, include_collections=False):
+        target.change_seq = _flush_version(session, connection, mapper.local_table)
+
+
+def _before_delete(mapper, connection, target):
+    if _tracked(mapper):
+        session = object_session(target)
+        version = _flush_version(session, connection, mapper.local_table)
+        session.info.setdefault('tombstones', []).append(
+            {'table_name': mapper.local_table.name, 'row_id': target.id, 'version': version, 'deleted_at': _utcnow()}
+        )
+
+
+# Mapper events also see rows deleted by cascades, which never show up in
+# session.deleted.
+event.listen(db.Model, 'before_insert', _before_insert, propagate=True)
+event.listen(db.Model, 'before_update', _before_update, propagate=True)
+event.listen(db.Model, 'before_delete', _before_delete, propagate=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _write_tombstones(session, flush_context):
+    session.info.pop('flush_versions', None)
+    tombstones = session.info.pop('tombstones', None)
+    if tombstones:
+        session.connection().execute(insert(TOMBSTONE_TABLE), tombstones)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_after_commit(session):
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        for listener in commit_listeners:
+            listener(tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    for key in ('flush_versions', 'tombstones', 'changed_tables'):
+        session.info.pop(key, None)
+
+
+@functools.lru_cache(maxsize=None)
+def resource_tables(model, include=()):
+    """Names of the tables a representation of `model` with `include` reads."""
+    tables = set()
+
+    def walk(model, tree):
+        tables.add(model.__table__.name)
+        mapper = inspect(model)
+        for key, subtree in tree.items():
+            walk(mapper.relationships[key].mapper.class_, subtree)
+
+    walk(model, include_tree(include))
+    return frozenset(tables)
+
+
+def table_versions(tables):
+    """Current {table_name: (version, updated_at)} for `tables`. Reads only
+    the small version table, never the tables themselves."""
+    rows = db.session.execute(
+        select(VERSION_TABLE.c.table_name, VERSION_TABLE.c.version, VERSION_TABLE.c.updated_at)
+        .where(VERSION_TABLE.c.table_name.in_(sorted(tables)))
+    )
+    return {name: (version, updated_at) for name, version, updated_at in rows}
+
+
+class Validators:
+    """ETag and Last-Modified for a response built from `tables`. `scope`
+    identifies the representation and defaults to the request path and
+    query string; `vary` names the request headers it also depends on."""
+
+    def __init__(self, tables, scope=None, vary=()):
+        self.versions = versions = table_versions(tables)
+        self.vary = vary
+
+        digest = hashlib.sha1((scope or request.full_path).encode('utf-8'))
+        for name in sorted(tables):
+            version, _ = versions.get(name, (0, None))
+            digest.update(f'|{name}:{version}'.encode('ascii'))
+        self.etag = digest.hexdigest()
+
+        modified = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+        self.last_modified = max(modified) if modified else None
+
+    def not_modified(self):
+        return request.if_none_match.contains(self.etag)
+
+    def headers(self):
+        headers = {'ETag': f'"{self.etag}"'}
+        if self.vary:
+            headers['Vary'] = ', '.join(self.vary)
+        if self.last_modified is not None:
+            headers['Last-Modified'] = http_date(self.last_modified.replace(tzinfo=datetime.timezone.utc))
+        return headers
+
+    def not_modified_response(self):
+        return Response(status=304, headers=self.headers())